@@ -0,0 +1,159 @@
+import asyncio
+from contextlib import asynccontextmanager
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import time
+import config
+import db
+import profiler
+from dialect import SQLITE
+
+_pool = None
+_pool_lock = asyncio.Lock()
+_sqlite = None
+_tx = contextvars.ContextVar('adb_tx', default=None)
+
+
+async def _mysql_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            import aiomysql
+            _pool = await aiomysql.create_pool(host=config.DB_HOST, port=config.DB_PORT, user=config.DB_USER, password=config.DB_PASS, db=config.DB_NAME,
+                                               minsize=config.DB_POOL_MIN, maxsize=config.ASYNC_DB_POOL_MAX, pool_recycle=config.DB_POOL_RECYCLE,
+                                               cursorclass=aiomysql.DictCursor, autocommit=True)
+    return _pool
+
+
+class _SqlitePool:
+    def __init__(self, size):
+        import sqlite_db
+        self.pool = db.Pool(sqlite_db.connect, min_size=0, max_size=size, recycle=config.DB_POOL_RECYCLE, idle_timeout=config.DB_POOL_IDLE)
+        self.slots = asyncio.Semaphore(size)
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='adb')
+
+    def run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+
+def _sqlite_pool():
+    global _sqlite
+    if _sqlite is None:
+        _sqlite = _SqlitePool(config.ASYNC_DB_POOL_MAX)
+    return _sqlite
+
+
+async def _acquire():
+    if SQLITE:
+        p = _sqlite_pool()
+        await p.slots.acquire()
+        try:
+            return await p.run(p.pool.acquire)
+        except BaseException:
+            p.slots.release()
+            raise
+    return await (await _mysql_pool()).acquire()
+
+
+def _release(conn, broken=False):
+    if SQLITE:
+        _sqlite.pool.release(conn, broken=broken)
+        _sqlite.slots.release()
+    elif broken:
+        conn.close()
+        _pool.release(conn)
+    else:
+        _pool.release(conn)
+
+
+def _sync_run(conn, sql, params, many):
+    with conn.cursor() as cur:
+        n = cur.executemany(sql, params) if many else cur.execute(sql, params or ())
+        rows = cur.fetchall() if cur.description else None
+        return n, cur.lastrowid, rows
+
+
+async def _run(conn, sql, params=None, many=False):
+    start = time.perf_counter()
+    if SQLITE:
+        n, lastrowid, rows = await _sqlite.run(_sync_run, conn, sql, params, many)
+    else:
+        async with conn.cursor() as cur:
+            n = await (cur.executemany(sql, params) if many else cur.execute(sql, params or ()))
+            rows = await cur.fetchall() if cur.description else None
+            lastrowid = cur.lastrowid
+    profiler.db_call(None, sql, params, time.perf_counter() - start, len(rows) if rows else 0, many)
+    return n, lastrowid, rows
+
+
+@asynccontextmanager
+async def connection():
+    conn = _tx.get()
+    if conn is not None:
+        yield conn
+        return
+    conn = await _acquire()
+    broken = False
+    try:
+        yield conn
+    except db.DISCONNECT_ERRORS:
+        broken = True
+        raise
+    finally:
+        _release(conn, broken)
+
+
+async def query(sql, params=None, one=False):
+    async with connection() as conn:
+        rows = (await _run(conn, sql, params))[2] or []
+    return (rows[0] if rows else None) if one else rows
+
+
+async def execute(sql, params=None):
+    async with connection() as conn:
+        return (await _run(conn, sql, params))[1]
+
+
+async def execute_rowcount(sql, params=None):
+    async with connection() as conn:
+        return (await _run(conn, sql, params))[0]
+
+
+async def execute_many(sql, seq):
+    seq = list(seq)
+    if not seq:
+        return 0
+    async with connection() as conn:
+        return (await _run(conn, sql, seq, many=True))[0]
+
+
+async def _call(conn, name):
+    if SQLITE:
+        return await _sqlite.run(getattr(conn, name))
+    return await getattr(conn, name)()
+
+
+@asynccontextmanager
+async def transaction():
+    if _tx.get() is not None:
+        yield _tx.get()
+        return
+    async with connection() as conn:
+        token = _tx.set(conn)
+        await _call(conn, 'begin')
+        try:
+            yield conn
+            await _call(conn, 'commit')
+        except BaseException:
+            await _call(conn, 'rollback')
+            raise
+        finally:
+            _tx.reset(token)
+
+
+async def close():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
@@ -1,18 +1,61 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, flash, get_flashed_messages, stream_with_context, send_file, abort, g, session
+import click
+import io
 from datetime import date, timedelta, datetime
-import csv, io
 import config
-from db import close_db, query, execute
-import os
-from difflib import get_close_matches
+from db import close_db, query, execute, stream, pool_stats
 from helpers import *
-
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+import catalog
+import images
+import imgproxy
+import respcache
+import library_stats
+import auth
+from auth import current_user
+import normalize
+import profiler
+import planner
+import sampler
+import scheduler
+from library_io import import_csv, export_stream
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = config.SECRET_KEY
 app.teardown_appcontext(close_db)
+app.before_request(profiler.start)
+app.after_request(profiler.finish)
+if config.SCHEDULER_ENABLED:
+    scheduler.start(app)
+
+
+PUBLIC_ENDPOINTS = {'static', 'img_proxy', 'login'}
+
+
+@app.before_request
+def load_user():
+    if request.endpoint == 'metrics' and auth.metrics_allowed():
+        g.user_id = None
+        return
+    g.user_id = auth.resolve()
+    if g.user_id is None and request.endpoint not in PUBLIC_ENDPOINTS:
+        if request.path.startswith('/api/') or request.accept_mimetypes.best == 'application/json':
+            return jsonify({'error': 'unauthorized'}), 401
+        return redirect(url_for('login'))
+
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        if auth.login(request.form.get('token', '').strip()):
+            return redirect(url_for('today'))
+        return render_template('login.html', error='Unknown token'), 401
+    return render_template('login.html', error=None)
+
+
+@app.post('/logout')
+def logout():
+    session.pop('user_id', None)
+    return redirect(url_for('login'))
 
 
 @app.context_processor
@@ -24,46 +67,141 @@ def url_helpers():
     return dict(url_for_history=url_for_history)
 
 
+@app.template_filter('img_size')
+def img_size(url, size='card'):
+    if url and url.startswith(('http://', 'https://')):
+        return url_for('img_proxy', key=imgproxy.sign(url), s=size) if imgproxy.allowed(url) else url
+    return images.variant_url(url, size)
+
+
+def queue_image(img_file):
+    url, job = images.pipeline.submit(img_file.read())
+    return (images.PLACEHOLDER, job) if job else (url, None)
+
+
+def attach_image(job, dish_id, user_id, previous=None):
+    def done(f):
+        url = previous if f.exception() else f.result()
+        if not url:
+            return
+        with app.app_context():
+            if catalog.set_image(dish_id, user_id, url, only_if=images.PLACEHOLDER):
+                respcache.bump_dish(dish_id)
+    if job:
+        job.add_done_callback(done)
+
+
+def json_row(r):
+    return {k: v.isoformat() if isinstance(v, (date, datetime)) else v for k, v in r.items()} if r else r
+
+
 @app.route('/')
 def today():
-    pick = get_or_create_today_plan(1)
-    alts = alt_picks(pick['id'], 1, 3) if pick else []
-    recent = query('SELECT d.*, dp.date AS cooked_date FROM day_plan dp JOIN dishes d ON d.id=dp.dish_id WHERE dp.user_id=%s ORDER BY dp.date DESC LIMIT 6', (1,))
-    cooldown = get_cooldown_days(1)
-    return render_template('today.html', pick=pick, alts=alts, recent=recent, days_ago=days_ago, cooldown=cooldown, rotate_seconds=config.DEV_ROTATE_SECONDS)
+    b = today_bundle(current_user())
+    return render_template('today.html', pick=b['pick'], alts=b['alts'], recent=b['recent'], days_ago=days_ago, cooldown=b['cooldown'], rotate_seconds=config.DEV_ROTATE_SECONDS)
+
+
+@app.get('/api/today')
+def api_today():
+    b = today_bundle(current_user(), force=bool(request.args.get('force')))
+    if not b['pick']:
+        return jsonify({}), 404
+    pick = dict(json_row(b['pick']), hero_url=img_size(b['pick'].get('image_url') or '/static/img/placeholder.jpg', 'hero'))
+    return jsonify({'pick': pick, 'alts': b['alts'], 'recent': [json_row(r) for r in b['recent']], 'cooldown': b['cooldown']})
 
 
 @app.get('/api/pick')
 def api_pick():
     force = request.args.get('force')
-    p = pick_candidate(1) if force else get_or_create_today_plan(1)
+    p = pick_candidate(current_user()) if force else get_or_create_today_plan(current_user())
     if not p:
         return jsonify({}), 404
-    x = dict(p)
-    v = x.get('last_cooked_at')
-    if isinstance(v, (date, datetime)):
-        x['last_cooked_at'] = v.isoformat()
-    return jsonify(x)
+    return jsonify(json_row(p))
+
+
+@app.route('/api/plan', methods=['GET', 'POST'])
+def api_plan():
+    try:
+        start = date.fromisoformat(request.values['start']) if request.values.get('start') else date.today()
+        days = int(request.values.get('days', 7) or 7)
+    except ValueError:
+        return jsonify({'error': 'bad start or days'}), 400
+    write = request.method == 'POST' and not request.values.get('dry_run')
+    plan = planner.plan_range(current_user(), start, days, write=write)
+    return jsonify({'start': start.isoformat(), 'days': [{'date': p['date'].isoformat(), 'new': p['new'], 'dish': json_row(p['dish'])} for p in plan]})
+
+
+@app.get('/api/metrics')
+def api_metrics():
+    return jsonify({'db_pool': pool_stats(), 'mealdb': dict(mealdb.stats, coalesced=mealdb.flight.shared, disk=mealdb.cache.snapshot()), 'scheduler': scheduler.stats(), 'images': images.pipeline.snapshot(), 'img_proxy': imgproxy.proxy.snapshot(), 'response_cache': respcache.stats(), 'slow_queries': profiler.slow_queries()})
+
+
+@app.get('/metrics')
+def metrics():
+    pool = pool_stats()
+    extra = {f'mealmind_db_pool_{k}': v for k, v in pool.items() if isinstance(v, (int, float))}
+    extra['mealmind_image_queue_depth'] = images.pipeline.snapshot()['queued']
+    return Response(profiler.metrics_text(extra), mimetype='text/plain; version=0.0.4')
+
+
+@app.get('/api/stats')
+def api_stats():
+    s = library_stats.get(current_user())
+    return jsonify(dict(s, summary=library_stats.summary(s)))
+
+
+@app.cli.command('create-user')
+@click.argument('name')
+@click.argument('email', required=False)
+def create_user(name, email=None):
+    uid, token = auth.create_user(name, email)
+    print(f'user {uid} token {token}')
+
+
+@app.cli.command('add-alias')
+@click.argument('alias')
+@click.argument('canonical')
+def add_alias(alias, canonical):
+    normalize.set_alias(alias, canonical)
+    print(f'{alias} -> {canonical}')
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    users = query('SELECT id FROM users')
+    for u in users:
+        library_stats.rebuild(u['id'])
+    print(f'rebuilt library stats for {len(users)} users')
+
+
+@app.get('/img/<key>')
+def img_proxy(key):
+    size = request.args.get('s', 'card')
+    if size not in dict(images.SIZES):
+        abort(404)
+    try:
+        url = imgproxy.unsign(key)
+    except imgproxy.BadKey:
+        abort(404)
+    try:
+        digest, data = imgproxy.proxy.get(url, size)
+    except Exception:
+        return redirect(url)
+    return send_file(io.BytesIO(data), mimetype='image/webp', etag=f'{digest}-{size}', conditional=True, max_age=config.IMG_PROXY_MAX_AGE)
 
 
 @app.post('/cook')
 def cook():
     dish_id = int(request.form['dish_id'])
     next_url = request.form.get('next') or url_for('today')
-    today_d = date.today()
-    exist = query('SELECT id FROM day_plan WHERE user_id=%s AND date=%s', (1, today_d), one=True)
-    if not exist:
-        execute('INSERT INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,0)', (1, today_d, dish_id))
-    else:
-        execute('UPDATE day_plan SET dish_id=%s,is_override=0 WHERE id=%s', (dish_id, exist['id']))
-    execute('UPDATE user_library SET last_cooked_at=%s WHERE user_id=%s AND dish_id=%s', (today_d, 1, dish_id))
+    record_plan(current_user(), date.today(), dish_id, 0)
     return redirect(next_url)
 
 
 @app.post('/swap')
 def swap():
     dish_id = int(request.form['dish_id'])
-    alts = alt_picks(dish_id, 1, 3)
+    alts = alt_picks(dish_id, current_user(), 3)
     return jsonify(alts)
 
 
@@ -74,6 +212,8 @@ def override_get():
 
 @app.post('/admin/seed_pk_basics')
 def seed_pk_basics():
+    if not auth.is_admin(current_user()):
+        abort(403)
     catalog = [
         {'name':'Dal Chawal','cuisine':'Pakistani','time_min':35,'difficulty':'Easy','veg':1,'spice_level':'Medium','ings':['rice','dal','onion','tomato','garlic','ginger','cumin','turmeric','red chili','salt','oil']},
         {'name':'Khichdi','cuisine':'Pakistani','time_min':30,'difficulty':'Easy','veg':1,'spice_level':'Low','ings':['rice','moong dal','onion','ginger','cumin','turmeric','salt','ghee']},
@@ -83,49 +223,65 @@ def seed_pk_basics():
         {'name':'Tarka Dal & Zeera Rice','cuisine':'Pakistani','time_min':40,'difficulty':'Medium','veg':1,'spice_level':'Medium','ings':['rice','dal','onion','garlic','ginger','cumin','green chili','ghee','salt']},
         {'name':'Urad Dal Mash + Rice','cuisine':'Pakistani','time_min':45,'difficulty':'Medium','veg':1,'spice_level':'Medium','ings':['rice','urad dal','onion','tomato','garlic','ginger','cumin','red chili','salt','oil']}
     ]
-    for d in catalog:
-        did = ensure_dish(d)
-        link_di(did, d['ings'])
-        execute('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (1, did))
+    upsert_dishes(catalog, current_user())
+    invalidate_user(current_user())
     return redirect(url_for('library'))
 
 
 @app.post('/override')
 def override_post():
     raw = request.form.get('ingredients','').strip()
-    lib = match_dishes(raw)
-    web = web_find_recipes(raw)
+    if progressive_override():
+        prefetch_web(raw)
+        return render_override(raw, match_dishes(raw), [], pending=True)
+    lib, web, partial = override_search(raw)
+    return render_override(raw, lib, web, partial)
+
+
+@app.get('/api/override/web')
+def api_override_web():
+    raw = request.args.get('q','').strip()
+    return override_web_json(raw, *override_web(raw))
+
+
+def progressive_override():
+    return config.OVERRIDE_PROGRESSIVE or request.form.get('progressive') == '1'
+
+
+def render_override(raw, lib, web, partial=False, pending=False):
     items = combine_override_results(raw, lib, web)
-    return render_template('override_results.html', raw=raw, items=items, lib_count=len(lib), web_count=len(web))
+    return render_template('override_results.html', raw=raw, items=items, lib_count=len(lib), web_count=len(web), partial=partial, pending=pending)
+
+
+def override_web_json(raw, web, partial):
+    items = combine_override_results(raw, [], web)
+    return jsonify({'count': len(items), 'partial': partial, 'html': render_template('override_items.html', raw=raw, items=items)})
 
 
 @app.post('/override/add')
 def override_add():
     dish_id = int(request.form['dish_id'])
-    execute('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (1,dish_id))
+    add_to_library(current_user(), dish_id)
+    invalidate_user(current_user())
     return redirect(url_for('library'))
 
 
 @app.post('/override/confirm')
 def override_confirm():
     dish_id = int(request.form['dish_id'])
-    today_d = date.today()
-    exist = query('SELECT id FROM day_plan WHERE user_id=%s AND date=%s', (1, today_d), one=True)
-    if not exist:
-        execute('INSERT INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,1)', (1, today_d, dish_id))
-    else:
-        execute('UPDATE day_plan SET dish_id=%s,is_override=1 WHERE id=%s', (dish_id, exist['id']))
-    execute('UPDATE user_library SET last_cooked_at=%s WHERE user_id=%s AND dish_id=%s', (today_d, 1, dish_id))
+    record_plan(current_user(), date.today(), dish_id, 1)
     return redirect(url_for('today'))
 
 
 @app.get('/library')
+@respcache.cached('library')
 def library():
     q = request.args.get('q','').strip()
     if q:
-        rows = query('SELECT d.*, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 AND d.name LIKE %s ORDER BY d.name ASC', (1, f'%{q}%'))
+        cond, arg = name_search_sql(q)
+        rows = query('SELECT d.*, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 AND ' + cond + ' ORDER BY d.name ASC', (current_user(), arg))
     else:
-        rows = query('SELECT d.*, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 ORDER BY d.name ASC', (1,))
+        rows = query('SELECT d.*, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 ORDER BY d.name ASC', (current_user(),))
     return render_template('library.html', rows=rows, q=q, days_ago=days_ago)
 
 
@@ -140,38 +296,38 @@ def library_add():
     spice = request.form.get('spice_level','Medium')
     img_url_text = request.form.get('image_url','').strip()
     img_file = request.files.get('image')
+    job = None
     if img_file and img_file.filename:
-        img = save_image(img_file)
-    elif img_url_text:
-        img = img_url_text
+        try:
+            img, job = queue_image(img_file)
+        except ValueError:
+            abort(400)
     else:
-        img = '/static/img/placeholder.jpg'
-    row = query('SELECT id FROM dishes WHERE name=%s', (name,), one=True)
-    if not row:
-        dish_id = execute('INSERT INTO dishes (name,cuisine,time_min,difficulty,veg,spice_level,image_url) VALUES (%s,%s,%s,%s,%s,%s,%s)', (name,cuisine,time_min,difficulty,veg,spice,img))
-    else:
-        dish_id = row['id']
-        execute('UPDATE dishes SET image_url=%s WHERE id=%s', (img, dish_id))
-    execute('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (1,dish_id))
-    toks = ingredient_terms_from_text(ingredients)
-    for t in toks:
-        ing = query('SELECT id FROM ingredients WHERE name=%s', (t,), one=True)
-        iid = ing['id'] if ing else execute('INSERT INTO ingredients (name) VALUES (%s)', (t,))
-        execute('INSERT IGNORE INTO dish_ingredients (dish_id,ingredient_id) VALUES (%s,%s)', (dish_id,iid))
+        img = img_url_text or None
+    dish_id = upsert_dish({'name': name, 'cuisine': cuisine, 'time_min': time_min, 'difficulty': difficulty, 'veg': veg, 'spice_level': spice,
+                           'image_url': img, 'ings': ingredient_terms_from_text(ingredients)}, current_user(), images='replace', owner=current_user())
+    if dish_id:
+        attach_image(job, dish_id, current_user())
+        if img:
+            respcache.bump_dish(dish_id)
+    invalidate_user(current_user())
     return redirect(url_for('library'))
 
 
 @app.get('/history')
+@respcache.cached('history')
 def history():
     q = request.args.get('q', '').strip()
     period = request.args.get('period', 'all')
     typ = request.args.get('type', 'all')
     page = max(int(request.args.get('page', 1) or 1), 1)
     per = min(max(int(request.args.get('per', 10) or 10), 5), 50)
+    mode = 'cursor' if request.args.get('mode') == 'cursor' else 'page'
+    cursor = request.args.get('cursor', '')
 
-    where = ['dp.user_id=%s']
-    params = [1]
     today = date.today()
+    where = ['dp.user_id=%s', 'dp.date<=%s']
+    params = [current_user(), today]
 
     if period != 'all':
         if period == 'today':
@@ -194,8 +350,9 @@ def history():
             params.extend([start, end])
 
     if q:
-        where.append('d.name LIKE %s')
-        params.append(f'%{q}%')
+        cond, arg = name_search_sql(q)
+        where.append(cond)
+        params.append(arg)
 
     if typ == 'override':
         where.append('dp.is_override=1')
@@ -203,51 +360,71 @@ def history():
         where.append('dp.is_override=0')
 
     base = ' FROM day_plan dp JOIN dishes d ON d.id=dp.dish_id WHERE ' + ' AND '.join(where)
-    total = query('SELECT COUNT(*) c' + base, params, one=True)['c']
-    rows = query('SELECT d.*, dp.date AS cooked_date, dp.is_override' + base + ' ORDER BY dp.date DESC, dp.id DESC LIMIT %s OFFSET %s', params + [per, (page - 1) * per])
+    total = history_count(current_user(), (period, typ, q), lambda: query('SELECT COUNT(*) c' + base, params, one=True)['c'])
+    cols = 'SELECT d.*, dp.id AS plan_id, dp.date AS cooked_date, dp.is_override' + base
+    next_cursor = None
+    if mode == 'cursor':
+        try:
+            cd, _, cid = cursor.partition('_')
+            cd, cid = date.fromisoformat(cd), int(cid)
+        except ValueError:
+            cursor = ''
+        if cursor:
+            cols += ' AND (dp.date < %s OR (dp.date = %s AND dp.id < %s))'
+            params = params + [cd, cd, cid]
+        rows = query(cols + ' ORDER BY dp.date DESC, dp.id DESC LIMIT %s', params + [per + 1])
+        if len(rows) > per:
+            rows = rows[:per]
+            next_cursor = f"{rows[-1]['cooked_date'].isoformat()}_{rows[-1]['plan_id']}"
+    else:
+        rows = query(cols + ' ORDER BY dp.date DESC, dp.id DESC LIMIT %s OFFSET %s', params + [per, (page - 1) * per])
     pages = max((total + per - 1) // per, 1)
 
-    return render_template('history.html', rows=rows, q=q, period=period, typ=typ, page=page, pages=pages, per=per, total=total)
+    return render_template('history.html', rows=rows, q=q, period=period, typ=typ, page=page, pages=pages, per=per, total=total, mode=mode, cursor=cursor, next_cursor=next_cursor)
 
 
 @app.get('/discover')
+@respcache.cached('discover', extra=lambda: week_start().isoformat(), before=lambda: ensure_weekly_web_discover(current_user(), total=12))
 def discover():
-    ensure_weekly_web_discover(1, total=12)
-    ws = week_start()
-    rows = query('SELECT id,name,image_url,source_url,time_min,cuisine,difficulty,veg FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s ORDER BY sort_rank ASC, id ASC', (1, ws, 'web'))
+    rows = query(DISCOVER_SQL, (current_user(), week_start(), 'web'))
+    return render_discover(rows)
+
+
+DISCOVER_SQL = 'SELECT id,name,image_url,source_url,time_min,cuisine,difficulty,veg FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s ORDER BY sort_rank ASC, id ASC'
+
+
+def render_discover(rows):
     picks = [{'source':'web','df_id':r['id'],'name':r['name'],'image_url':r['image_url'],'source_url':r['source_url'],'time_min':r['time_min'],'cuisine':r['cuisine'],'difficulty':r['difficulty'],'veg':r['veg']} for r in rows]
     return render_template('discover.html', picks=picks, weekly=True)
 
 
 @app.post('/discover/regen')
 def discover_regen():
-    ensure_weekly_web_discover(1)
+    ensure_weekly_web_discover(current_user(), force=True)
     return redirect(url_for('discover'))
 
 
 def discover_candidates(user_id=1, limit=3):
     ws = week_start()
-    return query('SELECT id,name,image_url,time_min,cuisine FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s ORDER BY RAND() LIMIT %s', (user_id, ws, 'web', limit))
+    rows = query('SELECT id,name,image_url,time_min,cuisine FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s', (user_id, ws, 'web'))
+    return sampler.rng.sample(rows, min(limit, len(rows)))
 
 
 @app.post('/discover/add')
 def discover_add():
     dish_id = int(request.form['dish_id'])
-    execute('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (1,dish_id))
+    add_to_library(current_user(), dish_id)
+    invalidate_user(current_user())
     return redirect(url_for('library'))
 
 
 @app.get('/settings')
+@respcache.cached('settings')
 def settings():
-    prefs = get_prefs(1)
-    stats = {}
-    stats['total'] = query('SELECT COUNT(*) c FROM user_library WHERE user_id=%s AND active=1', (1,), one=True)['c']
-    stats['cuisines'] = query('SELECT COUNT(DISTINCT d.cuisine) c FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 AND COALESCE(d.cuisine,"")<>""', (1,), one=True)['c']
-    avg = query('SELECT ROUND(AVG(d.time_min)) a FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1', (1,), one=True)['a']
-    stats['avg_time'] = avg or 0
-    vegp = query('SELECT ROUND(AVG(d.veg)*100) p FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1', (1,), one=True)['p']
-    stats['veg_pct'] = vegp or 0
-    return render_template('settings.html', prefs=prefs, stats=stats)
+    prefs = get_prefs(current_user())
+    stats = library_stats.summary(library_stats.get(current_user()))
+    imports = get_flashed_messages(category_filter=['import'])
+    return render_template('settings.html', prefs=prefs, stats=stats, import_report=imports[-1] if imports else None)
 
 
 @app.post('/settings')
@@ -263,20 +440,32 @@ def settings_save():
     allergies = request.form.get('allergies','')
     avoid = request.form.get('avoid','')
     theme = request.form.get('theme','light')
-    execute('INSERT INTO preferences (user_id,diet,spice_level,time_max,notify_time,daily_suggestions,weekly_discovery,auto_suggestions,cooldown_days,allergies,avoid,theme) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) ON DUPLICATE KEY UPDATE diet=VALUES(diet),spice_level=VALUES(spice_level),time_max=VALUES(time_max),notify_time=VALUES(notify_time),daily_suggestions=VALUES(daily_suggestions),weekly_discovery=VALUES(weekly_discovery),auto_suggestions=VALUES(auto_suggestions),cooldown_days=VALUES(cooldown_days),allergies=VALUES(allergies),avoid=VALUES(avoid),theme=VALUES(theme)', (1,diet,spice,time_max,notify,daily,weekly,auto,cooldown_days,allergies,avoid,theme))
+    execute('INSERT INTO preferences (user_id,diet,spice_level,time_max,notify_time,daily_suggestions,weekly_discovery,auto_suggestions,cooldown_days,allergies,avoid,theme) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) ON DUPLICATE KEY UPDATE diet=VALUES(diet),spice_level=VALUES(spice_level),time_max=VALUES(time_max),notify_time=VALUES(notify_time),daily_suggestions=VALUES(daily_suggestions),weekly_discovery=VALUES(weekly_discovery),auto_suggestions=VALUES(auto_suggestions),cooldown_days=VALUES(cooldown_days),allergies=VALUES(allergies),avoid=VALUES(avoid),theme=VALUES(theme)', (current_user(),diet,spice,time_max,notify,daily,weekly,auto,cooldown_days,allergies,avoid,theme))
+    invalidate_user(current_user())
     return redirect(url_for('settings'))
 
 
+def export_response(rows, columns, name):
+    fmt = 'ndjson' if request.args.get('format') == 'ndjson' else 'csv'
+    gz = request.args.get('gzip') in ('1', 'true')
+    filename = f'{name}.{fmt}' + ('.gz' if gz else '')
+    mimetype = 'application/gzip' if gz else ('application/x-ndjson' if fmt == 'ndjson' else 'text/csv')
+    body = stream_with_context(export_stream(rows, columns, fmt, gz))
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 @app.get('/settings/export')
 def export_library():
-    rows = query('SELECT d.name,d.cuisine,d.time_min,difficulty,veg,spice_level FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 ORDER BY d.name', (1,))
-    output = io.StringIO()
-    w = csv.writer(output)
-    w.writerow(['name','cuisine','time_min','difficulty','veg','spice_level'])
-    for r in rows:
-        w.writerow([r['name'], r['cuisine'] or '', r['time_min'] or '', r['difficulty'] or '', r['veg'] or 0, r['spice_level'] or ''])
-    csv_data = output.getvalue()
-    return Response(csv_data, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=library.csv'})
+    rows = stream('SELECT d.name,d.cuisine,d.time_min,difficulty,veg,spice_level,'
+                  '(SELECT GROUP_CONCAT(i.name ORDER BY i.name SEPARATOR "; ") FROM dish_ingredients di JOIN ingredients i ON i.id=di.ingredient_id WHERE di.dish_id=d.id) AS ingredients '
+                  'FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 ORDER BY d.name', (current_user(),))
+    return export_response(rows, ['name','cuisine','time_min','difficulty','veg','spice_level','ingredients'], 'library')
+
+
+@app.get('/history/export')
+def export_history():
+    rows = stream('SELECT dp.date,d.name,d.cuisine,d.time_min,dp.is_override FROM day_plan dp JOIN dishes d ON d.id=dp.dish_id WHERE dp.user_id=%s AND dp.date<=%s ORDER BY dp.date DESC, dp.id DESC', (current_user(), date.today()))
+    return export_response(rows, ['date','name','cuisine','time_min','is_override'], 'history')
 
 
 @app.post('/settings/import')
@@ -284,53 +473,44 @@ def import_library():
     f = request.files.get('file')
     if not f:
         return redirect(url_for('settings'))
-    text = f.read().decode('utf-8', errors='ignore')
-    reader = csv.DictReader(io.StringIO(text))
-    for row in reader:
-        name = (row.get('name') or '').strip()
-        if not name:
-            continue
-        cuisine = (row.get('cuisine') or '').strip()
-        time_min = int((row.get('time_min') or 30))
-        difficulty = (row.get('difficulty') or 'Easy').strip()
-        veg = 1 if str(row.get('veg') or '0') in ['1','true','True','yes','Yes'] else 0
-        spice = (row.get('spice_level') or 'Medium').strip()
-        img = '/static/img/placeholder.jpg'
-        d = query('SELECT id FROM dishes WHERE name=%s', (name,), one=True)
-        if not d:
-            dish_id = execute('INSERT INTO dishes (name,cuisine,time_min,difficulty,veg,spice_level,image_url) VALUES (%s,%s,%s,%s,%s,%s,%s)', (name,cuisine,time_min,difficulty,veg,spice,img))
-        else:
-            dish_id = d['id']
-        execute('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (1,dish_id))
+    report = import_csv(f.stream, current_user())
+    invalidate_user(current_user())
+    flash(report, 'import')
     return redirect(url_for('settings'))
 
 
 @app.post('/dish/<int:dish_id>/image')
 def dish_image(dish_id):
+    if not query('SELECT 1 x FROM user_library WHERE user_id=%s AND dish_id=%s', (current_user(), dish_id), one=True):
+        abort(404)
+    if not catalog.can_edit_image(dish_id, current_user()):
+        abort(403)
     img_file = request.files.get('image')
     img_url_text = request.form.get('image_url','').strip()
+    job = None
     if img_file and img_file.filename:
-        url = save_image(img_file)
+        try:
+            url, job = queue_image(img_file)
+        except ValueError:
+            abort(400)
     elif img_url_text:
         url = img_url_text
     else:
         return redirect(url_for('library'))
-    execute('UPDATE dishes SET image_url=%s WHERE id=%s', (url, dish_id))
+    previous = query('SELECT image_url FROM dishes WHERE id=%s', (dish_id,), one=True)['image_url']
+    catalog.set_image(dish_id, current_user(), url)
+    respcache.bump_dish(dish_id)
+    attach_image(job, dish_id, current_user(), previous)
     return redirect(url_for('library'))
 
 
 @app.post('/discover/import_cook')
 def discover_import_cook():
     df_id = int(request.form['df_id'])
-    did = materialize_discover(df_id, 1)
+    did = materialize_discover(df_id, current_user())
     if did:
-        today_d = date.today()
-        exist = query('SELECT id FROM day_plan WHERE user_id=%s AND date=%s', (1, today_d), one=True)
-        if not exist:
-            execute('INSERT INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,1)', (1, today_d, did))
-        else:
-            execute('UPDATE day_plan SET dish_id=%s,is_override=1 WHERE id=%s', (did, exist['id']))
-        execute('UPDATE user_library SET last_cooked_at=%s WHERE user_id=%s AND dish_id=%s', (today_d, 1, did))
+        record_plan(current_user(), date.today(), did, 1)
+    invalidate_user(current_user())
     return redirect(url_for('today'))
 
 
@@ -0,0 +1,159 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import io
+import sys
+from flask import request
+import config
+import adb
+import auth
+import respcache
+from app import app as flask_app, DISCOVER_SQL, render_discover, render_override, progressive_override, override_web_json
+from auth import current_user
+from helpers import amatch_dishes, aoverride_search, aoverride_web, aprefetch_web, aensure_weekly_web_discover, week_start
+
+executor = ThreadPoolExecutor(max_workers=config.ASGI_SYNC_WORKERS, thread_name_prefix='asgi-sync')
+inflight = asyncio.Semaphore(config.ASGI_MAX_INFLIGHT) if config.ASGI_MAX_INFLIGHT else None
+
+
+@respcache.acached('discover', extra=lambda: week_start().isoformat(), before=lambda: aensure_weekly_web_discover(current_user(), total=12))
+async def discover():
+    return render_discover(await adb.query(DISCOVER_SQL, (current_user(), week_start(), 'web')))
+
+
+async def override_post():
+    raw = request.form.get('ingredients','').strip()
+    if progressive_override():
+        aprefetch_web(raw)
+        return render_override(raw, await amatch_dishes(raw), [], pending=True)
+    lib, web, partial = await aoverride_search(raw)
+    return render_override(raw, lib, web, partial)
+
+
+async def api_override_web():
+    raw = request.args.get('q','').strip()
+    return override_web_json(raw, *await aoverride_web(raw))
+
+
+ROUTES = {('GET', '/discover'): discover, ('POST', '/override'): override_post, ('GET', '/api/override/web'): api_override_web}
+
+
+def _in_thread(fn, *args, context=None):
+    return asyncio.get_running_loop().run_in_executor(executor, (context or contextvars.copy_context()).run, fn, *args)
+
+
+async def _dispatch(view):
+    if inflight is None:
+        return await _run(view)
+    async with inflight:
+        return await _run(view)
+
+
+async def _run(view):
+    try:
+        await auth.aprime()
+        rv = flask_app.preprocess_request()
+        if rv is None:
+            rv = await view()
+    except Exception as e:
+        rv = flask_app.handle_user_exception(e)
+    return flask_app.finalize_request(rv)
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        msg = await receive()
+        chunks.append(msg.get('body', b''))
+        if not msg.get('more_body'):
+            return b''.join(chunks)
+
+
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    root = scope.get('root_path', '')
+    path = scope['path'][len(root):] if root and scope['path'].startswith(root) else scope['path']
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'asgi.scope': scope,
+    }
+    for k, v in scope['headers']:
+        name = k.decode('latin-1').upper().replace('-', '_')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        value = v.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _send(send, resp, method, context):
+    headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in resp.headers.to_wsgi_list()]
+    await send({'type': 'http.response.start', 'status': resp.status_code, 'headers': headers})
+    if not resp.is_streamed:
+        await send({'type': 'http.response.body', 'body': b'' if method == 'HEAD' else resp.get_data()})
+        return
+    chunks = iter(resp.iter_encoded())
+    try:
+        while True:
+            chunk = await _in_thread(next, chunks, None, context=context)
+            if chunk is None:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        resp.close()
+
+
+async def _http(scope, receive, send):
+    view = ROUTES.get((scope['method'], scope['path']))
+    ctx = flask_app.request_context(_environ(scope, await _read_body(receive)))
+    ctx.push()
+    context = contextvars.copy_context()
+    error = None
+    try:
+        try:
+            resp = await (_dispatch(view) if view else _in_thread(flask_app.full_dispatch_request, context=context))
+        except Exception as e:
+            error = e
+            resp = flask_app.handle_exception(e)
+        await _send(send, resp, scope['method'], context)
+    finally:
+        ctx.pop(error)
+
+
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif msg['type'] == 'lifespan.shutdown':
+            await adb.close()
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    await _http(scope, receive, send)
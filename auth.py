@@ -0,0 +1,115 @@
+import hashlib
+import hmac
+import secrets
+from flask import g, request, session
+import config
+from cache import TTLCache
+from db import query, execute, transaction
+import adb
+
+_tokens = TTLCache(maxsize=config.PREFS_CACHE_SIZE, ttl=config.TOKEN_CACHE_TTL)
+_issued = TTLCache(maxsize=1, ttl=5)
+
+TOKEN_SQL = 'SELECT user_id FROM api_tokens WHERE token_hash=%s AND revoked=0'
+ISSUED_SQL = 'SELECT 1 x FROM api_tokens WHERE revoked=0 LIMIT 1'
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_token(user_id, label=''):
+    token = secrets.token_urlsafe(32)
+    execute('INSERT INTO api_tokens (user_id,token_hash,label) VALUES (%s,%s,%s)', (user_id, hash_token(token), label))
+    _issued.set('any', True, ttl=0)
+    return token
+
+
+def create_user(name, email=None):
+    with transaction():
+        uid = execute('INSERT INTO users (name,email) VALUES (%s,%s)', (name, email))
+        execute('INSERT INTO preferences (user_id) VALUES (%s)', (uid,))
+        token = create_token(uid, 'default')
+    return uid, token
+
+
+def revoke_token(token):
+    h = hash_token(token)
+    execute('UPDATE api_tokens SET revoked=1 WHERE token_hash=%s', (h,))
+    _tokens.pop(h)
+
+
+def user_for_token(token):
+    h = hash_token(token)
+    uid = _tokens.get(h)
+    if uid is None:
+        row = query(TOKEN_SQL, (h,), one=True)
+        uid = row['user_id'] if row else 0
+        _tokens.set(h, uid)
+    return uid or None
+
+
+def _bearer():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[7:].strip()
+    return request.headers.get('X-API-Token')
+
+
+def _remember_issued(issued):
+    _issued.set('any', issued, ttl=0 if issued else None)
+    return issued
+
+
+def tokens_issued():
+    issued = _issued.get('any')
+    if issued is None:
+        issued = _remember_issued(bool(query(ISSUED_SQL, one=True)))
+    return issued
+
+
+def default_user():
+    if config.DEFAULT_USER_ID is not None:
+        return config.DEFAULT_USER_ID or None
+    return None if tokens_issued() else 1
+
+
+async def aprime():
+    token = _bearer()
+    if token:
+        h = hash_token(token)
+        if _tokens.get(h) is None:
+            row = await adb.query(TOKEN_SQL, (h,), one=True)
+            _tokens.set(h, row['user_id'] if row else 0)
+    elif not session.get('user_id') and config.DEFAULT_USER_ID is None and _issued.get('any') is None:
+        _remember_issued(bool(await adb.query(ISSUED_SQL, one=True)))
+
+
+def resolve():
+    token = _bearer()
+    if token:
+        return user_for_token(token)
+    uid = session.get('user_id')
+    if uid:
+        return uid
+    return default_user()
+
+
+def metrics_allowed():
+    token = _bearer()
+    return bool(config.METRICS_TOKEN and token and hmac.compare_digest(token, config.METRICS_TOKEN))
+
+
+def is_admin(user_id):
+    return user_id in config.ADMIN_USER_IDS
+
+
+def login(token):
+    uid = user_for_token(token)
+    if uid:
+        session['user_id'] = uid
+    return uid
+
+
+def current_user():
+    return g.user_id
@@ -0,0 +1,187 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUERIES = ['chicken rice', 'dal', 'paneer spinach', 'lamb', 'chickpea tomato', 'beef onion']
+CASES = {
+    'override': lambda i: ('POST', '/override', {'ingredients': f'{QUERIES[i % len(QUERIES)]} {i}'}),
+    'discover': lambda i: ('GET', '/discover', None),
+}
+
+
+def serve_api(port, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlparse(self.path)
+            q = parse_qs(url.query)
+            if url.path.endswith('filter.php'):
+                area = q.get('a', ['Indian'])[0]
+                meals = [{'idMeal': str(60000 + i), 'strMeal': f'{area} Dish {i}', 'strMealThumb': f'https://example.com/{area}{i}.jpg'} for i in range(30)]
+            else:
+                term = q.get('s', [''])[0]
+                meals = [{'idMeal': str(50000 + i), 'strMeal': f'{term.title()} Curry {i}', 'strArea': 'Indian', 'strMealThumb': f'https://example.com/{i}.jpg',
+                          'strIngredient1': term, 'strIngredient2': 'onion'} for i in range(3)]
+            body = json.dumps({'meals': meals}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    Server(('127.0.0.1', port), Handler).serve_forever()
+
+
+def serve_sync(port, threads):
+    from werkzeug.serving import ThreadedWSGIServer
+    from app import app
+
+    class PooledServer(ThreadedWSGIServer):
+        pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    PooledServer('127.0.0.1', port, app).serve_forever()
+
+
+def spawn(args, env):
+    return subprocess.Popen([sys.executable, *map(str, args)], cwd=ROOT, env=env)
+
+
+def server_args(mode, port, threads):
+    if mode == 'sync':
+        return [os.path.abspath(__file__), '--serve-sync', port, '--threads', threads]
+    return ['-m', 'uvicorn', 'asgi:app', '--port', port, '--log-level', 'warning', '--no-access-log']
+
+
+def wait_ready(url, proc, timeout=30):
+    import requests
+    stop = time.monotonic() + timeout
+    while time.monotonic() < stop:
+        if proc.poll() is not None:
+            raise SystemExit(f'server exited with {proc.returncode}')
+        try:
+            requests.get(url, timeout=5)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f'server at {url} did not start')
+
+
+def drive(base, case, total, concurrency, headers):
+    import requests
+    counter = iter(range(total))
+    lock = threading.Lock()
+    out = []
+
+    def worker():
+        s = requests.Session()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            method, path, data = CASES[case](i)
+            t = time.perf_counter()
+            try:
+                status = s.request(method, base + path, data=data, headers=headers, timeout=120).status_code
+            except requests.RequestException:
+                status = 0
+            out.append((status, time.perf_counter() - t))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return out, time.perf_counter() - start
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))] * 1000 if xs else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Compare throughput of the WSGI and ASGI paths on network-bound routes.')
+    ap.add_argument('--case', choices=sorted(CASES), default='override')
+    ap.add_argument('--requests', type=int, default=400)
+    ap.add_argument('--concurrency', type=int, default=64)
+    ap.add_argument('--threads', type=int, default=8, help='worker threads for the sync server')
+    ap.add_argument('--latency', type=float, default=0.2, help='seconds the fake recipe API takes per call')
+    ap.add_argument('--modes', default='sync,async')
+    ap.add_argument('--token', help='API token to send; default runs the servers as user 1')
+    ap.add_argument('--port', type=int, default=8701)
+    ap.add_argument('--serve-sync', type=int, help=argparse.SUPPRESS)
+    ap.add_argument('--serve-api', type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve_sync:
+        return serve_sync(args.serve_sync, args.threads)
+    if args.serve_api:
+        return serve_api(args.serve_api, args.latency)
+
+    api_port = args.port + 10
+    api = spawn([os.path.abspath(__file__), '--serve-api', api_port, '--latency', args.latency], os.environ)
+    wait_ready(f'http://127.0.0.1:{api_port}/search.php', api)
+    cache_dir = tempfile.mkdtemp(prefix='mealdb-bench-')
+    env = dict(os.environ, MEALDB_BASE_URL=f'http://127.0.0.1:{api_port}', MEALDB_CACHE_DIR=cache_dir, MEALDB_CACHE_TTL='0',
+               SCHEDULER_ENABLED='0', DB_POOL_MAX=str(max(args.threads, 10)))
+    if not args.token:
+        env['DEFAULT_USER_ID'] = '1'
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+
+    print(f'case={args.case} requests={args.requests} concurrency={args.concurrency} sync_threads={args.threads} api_latency={args.latency * 1000:.0f}ms')
+    print(f'{"mode":<7}{"rps":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"errors":>8}')
+    results = {}
+    try:
+        for i, mode in enumerate(args.modes.split(',')):
+            port = args.port + i
+            base = f'http://127.0.0.1:{port}'
+            proc = spawn(server_args(mode, port, args.threads), env)
+            try:
+                wait_ready(base + '/login', proc)
+                drive(base, args.case, min(args.requests, args.concurrency), args.concurrency, headers)
+                out, took = drive(base, args.case, args.requests, args.concurrency, headers)
+            finally:
+                proc.terminate()
+                proc.wait()
+            xs = [d for _, d in out]
+            errors = sum(1 for s, _ in out if s >= 400 or s == 0)
+            results[mode] = len(out) / took
+            print(f'{mode:<7}{results[mode]:>9.1f}{pct(xs, 50):>8.1f}m{pct(xs, 95):>8.1f}m{pct(xs, 99):>8.1f}m{errors:>8}')
+    finally:
+        api.terminate()
+        api.wait()
+    if 'sync' in results and 'async' in results:
+        print(f'async/sync throughput: {results["async"] / results["sync"]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
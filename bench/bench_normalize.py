@@ -0,0 +1,109 @@
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normalize
+from helpers import compile_pref_filter
+from ingredient_index import IngredientIndex
+
+QUERIES = [
+    'chicken + rice', 'aloo and bhindi', 'dal | daal | masoor -onion', 'chkn, tomatoes, garlic',
+    'chana/rice -peas', 'Dāl chāwal', 'qeema + potatoes + green chilies', 'spinach or saag -cream',
+]
+PREFS = {'time_max': 45, 'diet': 'None', 'spice_level': 'Medium', 'allergies': 'peanuts, shrimp', 'avoid': 'mushrooms | eggplant'}
+WORDS = ['rice', 'chicken', 'onion', 'tomato', 'garlic', 'ginger', 'potato', 'okra', 'spinach', 'fish', 'dal', 'keema',
+         'masoor dal', 'moong dal', 'chana dal', 'urad dal', 'cumin', 'turmeric', 'red chili', 'green chili', 'cream', 'pea']
+
+
+def legacy_normalize_tokens(s):
+    s = s.lower().strip()
+    s = s.replace(',', ' ')
+    s = s.replace('/', ' | ')
+    s = re.sub(r'\band\b', '+', s)
+    s = re.sub(r'\bor\b', '|', s)
+    s = re.sub(r'\s+', ' ', s)
+    s = re.sub(r'([+\-|])', r' \1 ', s).strip()
+    op = '+'
+    required, optional, excluded = [], [], []
+    for p in s.split():
+        if p in ['+', '|', '-']:
+            op = p
+            continue
+        if p.endswith('s') and len(p) > 3:
+            p = p[:-1]
+        aliases = {
+            'chkn': 'chicken', 'chikn': 'chicken', 'chk': 'chicken', 'murghi': 'chicken',
+            'qeema': 'keema', 'keema': 'keema',
+            'aloo': 'potato', 'bhindi': 'okra', 'saag': 'spinach', 'machli': 'fish',
+            'dal': 'dal', 'daal': 'dal', 'dāl': 'dal',
+            'masoor': 'masoor dal', 'moong': 'moong dal', 'chanadal': 'chana dal', 'chana': 'chana dal', 'mash': 'urad dal', 'urad': 'urad dal',
+            'chawal': 'rice', 'chāwal': 'rice'
+        }
+        p = aliases.get(p, p)
+        (excluded if op == '-' else optional if op == '|' else required).append(p)
+    return required, optional, excluded
+
+
+def build_index(n_dishes, fanout, seed=1):
+    r = random.Random(seed)
+    idx = IngredientIndex(ttl=0)
+    idx.loaded_at = 1
+    names = WORDS + [f'ingredient {i}' for i in range(2000)]
+    for i, name in enumerate(names, 1):
+        idx.add_ingredient(i, name)
+    for d in range(1, n_dishes + 1):
+        idx.link(d, r.sample(range(1, len(names) + 1), fanout))
+    return idx
+
+
+def override_search(idx, raw, tokenize):
+    req, opt, ex = tokenize(raw)
+    req_ids = set(idx.resolve(req).values())
+    opt_ids = set(idx.resolve(opt).values())
+    ex_ids = set(idx.resolve(ex).values())
+    cand = idx.dishes_with_all(req_ids) if req_ids else idx.dishes_with_any(opt_ids)
+    if ex_ids:
+        cand -= idx.dishes_with_any(ex_ids)
+    return cand
+
+
+def bench(label, fn, number):
+    total = timeit.timeit(fn, number=number)
+    print(f'{label:<40}{total / number * 1e6:>10.2f} us/call')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Per-query cost of tokenizing, override search and preference filter compilation.')
+    ap.add_argument('--number', type=int, default=20000)
+    ap.add_argument('--dishes', type=int, default=20000)
+    ap.add_argument('--fanout', type=int, default=8)
+    args = ap.parse_args()
+    n = args.number
+
+    qs = iter(QUERIES * (n // len(QUERIES) + 2))
+    bench('normalize_tokens (legacy)', lambda: legacy_normalize_tokens(next(qs)), n)
+    normalize.clear_caches()
+    qs = iter(QUERIES * (n // len(QUERIES) + 2))
+    bench('normalize_tokens (cold cache)', lambda: (normalize.clear_caches(), normalize.normalize_tokens(next(qs))), n)
+    qs = iter(QUERIES * (n // len(QUERIES) + 2))
+    bench('normalize_tokens (warm cache)', lambda: normalize.normalize_tokens(next(qs)), n)
+    bench('ingredient_terms_from_text (warm)', lambda: normalize.ingredient_terms_from_text('rice, onions, tomatoes, garlic + ginger'), n)
+
+    bench('compile_pref_filter', lambda: compile_pref_filter(PREFS), n)
+
+    idx = build_index(args.dishes, args.fanout)
+    m = max(n // 20, 100)
+    qs = iter(QUERIES * (m // len(QUERIES) + 2))
+    bench(f'override search, {args.dishes} dishes (legacy)', lambda: override_search(idx, next(qs), legacy_normalize_tokens), m)
+    qs = iter(QUERIES * (m // len(QUERIES) + 2))
+    bench(f'override search, {args.dishes} dishes', lambda: override_search(idx, next(qs), normalize.normalize_tokens), m)
+    print(normalize.cache_info())
+
+
+if __name__ == '__main__':
+    main()
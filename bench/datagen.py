@@ -0,0 +1,99 @@
+import argparse
+from datetime import date, timedelta
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import auth
+import library_stats
+from db import query, execute, execute_many, transaction
+
+CUISINES = ['Pakistani', 'Indian', 'Afghan', 'Bangladeshi', 'Italian', 'Thai', 'Mexican', 'Chinese', 'Turkish', 'Persian']
+COMMON = ['rice', 'chicken', 'onion', 'tomato', 'garlic', 'ginger', 'potato', 'okra', 'spinach', 'fish', 'dal', 'keema',
+          'masoor dal', 'moong dal', 'chana dal', 'urad dal', 'cumin', 'turmeric', 'red chili', 'green chili', 'cream', 'pea']
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data.json')
+BATCH = 2000
+
+
+def batched(sql, rows):
+    for i in range(0, len(rows), BATCH):
+        execute_many(sql, rows[i:i + BATCH])
+
+
+def reset(prefix):
+    with transaction():
+        execute('DELETE FROM users WHERE name LIKE %s', (f'{prefix}%',))
+        execute('DELETE FROM dishes WHERE name LIKE %s', (f'{prefix}%',))
+        execute('DELETE FROM ingredients WHERE name LIKE %s', (f'{prefix}%',))
+
+
+def ids_like(table, prefix):
+    return [r['id'] for r in query(f'SELECT id FROM {table} WHERE name LIKE %s ORDER BY id', (f'{prefix}%',))]
+
+
+def generate(args):
+    r = random.Random(args.seed)
+    t0 = time.perf_counter()
+    reset(args.prefix)
+
+    ing_names = COMMON + [f'{args.prefix}ingredient {i}' for i in range(args.ingredients)]
+    batched('INSERT IGNORE INTO ingredients (name) VALUES (%s)', [(n,) for n in ing_names])
+    ing_ids = [r_['id'] for r_ in query('SELECT id FROM ingredients WHERE name IN (' + ','.join(['%s'] * len(COMMON)) + ')', COMMON)] + ids_like('ingredients', args.prefix)
+
+    batched('INSERT INTO dishes (name,cuisine,time_min,difficulty,veg,spice_level,image_url) VALUES (%s,%s,%s,%s,%s,%s,%s)',
+            [(f'{args.prefix}dish {i}', r.choice(CUISINES), r.choice([10, 15, 20, 30, 40, 45, 60, 90]), r.choice(['Easy', 'Medium', 'Hard']),
+              int(r.random() < 0.3), r.choice(['Low', 'Medium', 'High', 'Spicy']), '/static/img/placeholder.jpg') for i in range(args.dishes)])
+    dish_ids = ids_like('dishes', args.prefix)
+    batched('INSERT IGNORE INTO dish_ingredients (dish_id,ingredient_id) VALUES (%s,%s)',
+            [(d, i) for d in dish_ids for i in r.sample(ing_ids, min(args.fanout, len(ing_ids)))])
+    print(f'catalog: {len(dish_ids)} dishes, {len(ing_ids)} ingredients ({time.perf_counter() - t0:.1f}s)')
+
+    users = []
+    today = date.today()
+    days = int(args.years * 365)
+    for u in range(args.users):
+        uid, token = auth.create_user(f'{args.prefix}user {u}', None)
+        lib = r.sample(dish_ids, min(args.library, len(dish_ids)))
+        batched('INSERT INTO user_library (user_id,dish_id,rating,last_cooked_at) VALUES (%s,%s,%s,%s)',
+                [(uid, d, r.choice([None, 1, 2, 3, 4, 5]), today - timedelta(days=r.randint(1, max(days, 1))) if r.random() < 0.7 else None) for d in lib])
+        batched('INSERT IGNORE INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,%s)',
+                [(uid, today - timedelta(days=i), r.choice(lib), int(r.random() < 0.1)) for i in range(1, days + 1)])
+        execute('UPDATE preferences SET avoid=%s, allergies=%s WHERE user_id=%s', (r.choice(['', 'peas', 'cream | okra']), r.choice(['', 'fish']), uid))
+        library_stats.rebuild(uid)
+        users.append({'id': uid, 'token': token})
+    print(f'users: {len(users)} x {args.library} dishes, {days} days of plans ({time.perf_counter() - t0:.1f}s)')
+
+    with open(args.out, 'w') as f:
+        json.dump({'prefix': args.prefix, 'seed': args.seed, 'users': users, 'dishes': len(dish_ids), 'library': args.library,
+                   'fanout': args.fanout, 'years': args.years}, f, indent=1)
+    print(f'manifest written to {args.out}')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Load a reproducible synthetic dataset for benchmarks.')
+    ap.add_argument('--users', type=int, default=5)
+    ap.add_argument('--dishes', type=int, default=5000, help='catalog size (up to 100k)')
+    ap.add_argument('--library', type=int, default=1000, help='dishes per user library')
+    ap.add_argument('--ingredients', type=int, default=800)
+    ap.add_argument('--fanout', type=int, default=8, help='ingredients per dish')
+    ap.add_argument('--years', type=float, default=2, help='years of day_plan history per user')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--prefix', default='bench-')
+    ap.add_argument('--out', default=MANIFEST)
+    ap.add_argument('--reset', action='store_true', help='only delete previously generated data')
+    args = ap.parse_args()
+    with app.app_context():
+        if args.reset:
+            reset(args.prefix)
+            print('bench data removed')
+        else:
+            generate(args)
+
+
+if __name__ == '__main__':
+    main()
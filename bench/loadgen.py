@@ -0,0 +1,97 @@
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROUTES = ['/api/today', '/library', '/history', '/discover', '/settings', '/api/stats']
+
+
+def setup_users(n, prefix):
+    from app import app
+    import auth
+    tokens = []
+    with app.app_context():
+        for i in range(n):
+            tokens.append(auth.create_user(f'{prefix}{i}', f'{prefix}{i}@example.com')[1])
+    return tokens
+
+
+def http_client(base):
+    import requests
+    s = requests.Session()
+
+    def get(path, token):
+        r = s.get(base + path, headers={'Authorization': f'Bearer {token}'}, timeout=30)
+        return r.status_code
+    return get
+
+
+def local_client():
+    from app import app
+    c = app.test_client()
+
+    def get(path, token):
+        return c.get(path, headers={'Authorization': f'Bearer {token}'}).status_code
+    return get
+
+
+def worker(token, make_client, seconds, out):
+    get = make_client()
+    stop = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < stop:
+        path = ROUTES[i % len(ROUTES)]
+        i += 1
+        t = time.perf_counter()
+        try:
+            status = get(path, token)
+        except Exception:
+            status = 0
+        out.append((path, status, time.perf_counter() - t))
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))] * 1000 if xs else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Simulate N concurrent households hitting the app.')
+    ap.add_argument('--users', type=int, default=50)
+    ap.add_argument('--seconds', type=float, default=20)
+    ap.add_argument('--url', help='base URL of a running server; default drives the app in-process')
+    ap.add_argument('--tokens', help='file with one API token per line; default creates users')
+    ap.add_argument('--prefix', default='load-')
+    args = ap.parse_args()
+
+    if args.tokens:
+        with open(args.tokens) as f:
+            tokens = [l.strip() for l in f if l.strip()][:args.users]
+    else:
+        tokens = setup_users(args.users, args.prefix)
+    make_client = (lambda: http_client(args.url.rstrip('/'))) if args.url else local_client
+
+    out = []
+    threads = [threading.Thread(target=worker, args=(t, make_client, args.seconds, out)) for t in tokens]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    took = time.perf_counter() - start
+
+    errors = sum(1 for _, s, _ in out if s >= 400 or s == 0)
+    print(f'users={len(tokens)} requests={len(out)} errors={errors} rps={len(out) / took:.1f}')
+    print(f'{"route":<14}{"n":>7}{"p50":>9}{"p95":>9}{"p99":>9}{"mean":>9}')
+    for path in ROUTES:
+        xs = [d for p, _, d in out if p == path]
+        if xs:
+            print(f'{path:<14}{len(xs):>7}{pct(xs, 50):>8.1f}m{pct(xs, 95):>8.1f}m{pct(xs, 99):>8.1f}m{statistics.mean(xs) * 1000:>8.1f}m')
+
+
+if __name__ == '__main__':
+    main()
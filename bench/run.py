@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import g
+from app import app
+import helpers
+import profiler
+import respcache
+from datagen import MANIFEST
+
+QUERIES = ['rice + onion', 'chicken | fish -cream', 'dal + tomato + garlic', 'aloo, okra']
+
+
+def function_cases(uid):
+    return {
+        'pick_candidate': lambda i: helpers.pick_candidate(uid),
+        'alt_picks': lambda i: helpers.alt_picks(0, uid, 3),
+        'today_bundle': lambda i: helpers.today_bundle(uid),
+        'match_dishes': lambda i: helpers.match_dishes(QUERIES[i % len(QUERIES)]),
+        'pref_filter_sql': lambda i: helpers.pref_filter_sql(uid),
+    }
+
+
+ROUTES = {
+    'GET /': ('get', '/', None),
+    'GET /library': ('get', '/library', None),
+    'GET /history': ('get', '/history', None),
+    'GET /history?q=dish 1': ('get', '/history?q=dish%201', None),
+    'GET /history cursor': ('get', '/history?mode=cursor', None),
+    'POST /override': ('post', '/override', {'ingredients': 'rice + onion'}),
+}
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))] if xs else 0.0
+
+
+def summarize(times, queries):
+    return {'n': len(times), 'p50': pct(times, 50) * 1000, 'p95': pct(times, 95) * 1000, 'p99': pct(times, 99) * 1000,
+            'queries': sum(queries) / len(queries) if queries else 0}
+
+
+def run_function(uid, fn, n, warmup, cold):
+    times, queries = [], []
+    for i in range(warmup + n):
+        with app.test_request_context():
+            g.user_id = uid
+            if cold:
+                helpers.invalidate_user(uid)
+            profiler.start()
+            t = time.perf_counter()
+            fn(i)
+            took = time.perf_counter() - t
+            q = g._prof['db_calls']
+        if i >= warmup:
+            times.append(took)
+            queries.append(q)
+    return summarize(times, queries)
+
+
+def run_route(client, token, method, path, data, n, warmup, cold, uid, page_cache=False):
+    times, queries = [], []
+    headers = {'Authorization': f'Bearer {token}'}
+    for i in range(warmup + n):
+        if cold:
+            with app.app_context():
+                helpers.invalidate_user(uid)
+        elif not page_cache:
+            respcache.pages.clear()
+        t = time.perf_counter()
+        r = getattr(client, method)(path, headers=headers, data=data)
+        took = time.perf_counter() - t
+        assert r.status_code < 400, (path, r.status_code)
+        m = re.search(r'desc="(\d+) queries', r.headers.get('Server-Timing', ''))
+        if i >= warmup:
+            times.append(took)
+            queries.append(int(m.group(1)) if m else 0)
+    return summarize(times, queries)
+
+
+def compare(results, baseline, tolerance):
+    worse = []
+    print(f'\n{"case":<24}{"p50 base":>10}{"p50 now":>10}{"delta":>9}{"q base":>8}{"q now":>8}')
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b:
+            print(f'{name:<24}{"-":>10}{r["p50"]:>10.2f}')
+            continue
+        delta = (r['p50'] - b['p50']) / b['p50'] * 100 if b['p50'] else 0
+        flag = ''
+        if delta > tolerance or r['queries'] > b['queries']:
+            flag = '  REGRESSION'
+            worse.append(name)
+        print(f'{name:<24}{b["p50"]:>10.2f}{r["p50"]:>10.2f}{delta:>8.1f}%{b["queries"]:>8.1f}{r["queries"]:>8.1f}{flag}')
+    return worse
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark suggestion and search hot paths against the datagen dataset.')
+    ap.add_argument('--manifest', default=MANIFEST)
+    ap.add_argument('-n', type=int, default=50, help='measured iterations per case')
+    ap.add_argument('--warmup', type=int, default=5)
+    ap.add_argument('--cold', action='store_true', help='drop per-user caches before every call')
+    ap.add_argument('--page-cache', action='store_true', help='let route cases hit the rendered-page cache (measures cache hits, not the views)')
+    ap.add_argument('--only', help='regex of case names to run')
+    ap.add_argument('--save', help='write results as a baseline JSON file')
+    ap.add_argument('--compare', help='baseline JSON file to compare against')
+    ap.add_argument('--tolerance', type=float, default=15.0, help='allowed p50 slowdown in percent')
+    args = ap.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    user = manifest['users'][0]
+    only = re.compile(args.only) if args.only else None
+    results = {}
+
+    for name, fn in function_cases(user['id']).items():
+        if not only or only.search(name):
+            results[name] = run_function(user['id'], fn, args.n, args.warmup, args.cold)
+    client = app.test_client()
+    for name, (method, path, data) in ROUTES.items():
+        if not only or only.search(name):
+            results[name] = run_route(client, user['token'], method, path, data, args.n, args.warmup, args.cold, user['id'], args.page_cache)
+
+    print(f'dataset: {manifest["dishes"]} dishes, library {manifest["library"]}, {manifest["years"]}y history, {"cold" if args.cold else "warm"} caches, page cache {"on" if args.page_cache else "off"}')
+    print(f'{"case":<24}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}')
+    for name, r in results.items():
+        print(f'{name:<24}{r["p50"]:>9.2f}{r["p95"]:>9.2f}{r["p99"]:>9.2f}{r["queries"]:>9.1f}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'manifest': {k: v for k, v in manifest.items() if k != 'users'}, 'cold': args.cold, 'page_cache': args.page_cache, 'results': results}, f, indent=1)
+        print(f'baseline saved to {args.save}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        worse = compare(results, baseline, args.tolerance)
+        if worse:
+            print(f'{len(worse)} regression(s): {", ".join(worse)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+from datetime import date
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import auth
+from db import query
+from helpers import add_to_library
+
+ROUTES = ['/api/pick', '/api/today', '/api/pick?force=1', '/api/today?force=1', '/']
+
+
+def setup(dishes):
+    with app.app_context():
+        uid, token = auth.create_user('stress-plan', None)
+        for r in query('SELECT id FROM dishes ORDER BY id LIMIT %s', (dishes,)):
+            add_to_library(uid, r['id'])
+    return uid, token
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Hammer plan creation from many threads and check one plan per day.')
+    ap.add_argument('--threads', type=int, default=32)
+    ap.add_argument('--requests', type=int, default=20, help='requests per thread')
+    ap.add_argument('--dishes', type=int, default=50)
+    args = ap.parse_args()
+
+    uid, token = setup(args.dishes)
+    headers = {'Authorization': f'Bearer {token}'}
+    barrier = threading.Barrier(args.threads)
+    seen, lock = set(), threading.Lock()
+
+    def hammer(i):
+        c = app.test_client()
+        barrier.wait()
+        for j in range(args.requests):
+            path = ROUTES[(i + j) % len(ROUTES)]
+            r = c.get(path, headers=headers)
+            assert r.status_code == 200, (path, r.status_code)
+            if path == '/api/pick':
+                with lock:
+                    seen.add(r.get_json()['id'])
+            elif path == '/api/today':
+                with lock:
+                    seen.add(r.get_json()['pick']['id'])
+
+    with ThreadPoolExecutor(args.threads) as ex:
+        list(ex.map(hammer, range(args.threads)))
+
+    with app.app_context():
+        plans = query('SELECT dish_id FROM day_plan WHERE user_id=%s AND date=%s', (uid, date.today()))
+    print(f'user={uid} requests={args.threads * args.requests} plans_today={len(plans)} picks_seen={sorted(seen)}')
+    assert len(plans) == 1, f'expected exactly one plan, found {len(plans)}'
+    assert seen == {plans[0]['dish_id']}, f'requests saw different picks: {sorted(seen)}'
+    print('ok')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+from db import query, execute_rowcount, execute_many, transaction, after_commit
+from ingredient_index import index as ingredient_index
+import library_stats
+from normalize import term
+
+PLACEHOLDER = '/static/img/placeholder.jpg'
+DEFAULTS = {'cuisine': '', 'time_min': 30, 'difficulty': 'Easy', 'veg': 0, 'spice_level': 'Medium'}
+
+
+def _key(name):
+    return ' '.join(name.split()).lower()
+
+
+IMAGE_OWNER_SQL = ('(created_by=%s OR (created_by IS NULL AND NOT EXISTS '
+                   '(SELECT 1 FROM user_library ul WHERE ul.dish_id=dishes.id AND ul.user_id<>%s)))')
+
+
+def can_edit_image(dish_id, user_id):
+    return bool(query('SELECT 1 x FROM dishes WHERE id=%s AND ' + IMAGE_OWNER_SQL, (dish_id, user_id, user_id), one=True))
+
+
+def set_image(dish_id, user_id, url, only_if=None):
+    sql = 'UPDATE dishes SET image_url=%s WHERE id=%s AND ' + IMAGE_OWNER_SQL
+    params = [url, dish_id, user_id, user_id]
+    if only_if is not None:
+        sql += ' AND image_url=%s'
+        params.append(only_if)
+    return execute_rowcount(sql, params)
+
+
+def _in(sql, values):
+    return query(sql.format(','.join(['%s'] * len(values))), list(values)) if values else []
+
+
+def _ensure_ingredients(names):
+    ids = {r['name']: r['id'] for r in _in('SELECT id,name FROM ingredients WHERE name IN ({})', names)}
+    new = [n for n in names if n not in ids]
+    if new:
+        execute_many('INSERT IGNORE INTO ingredients (name) VALUES (%s)', [(n,) for n in new])
+        added = _in('SELECT id,name FROM ingredients WHERE name IN ({})', new)
+        for r in added:
+            ids[r['name']] = r['id']
+
+        def apply():
+            for r in added:
+                ingredient_index.add_ingredient(r['id'], r['name'])
+        after_commit(apply)
+    return ids
+
+
+def link_ingredients(links):
+    names = []
+    for ings in links.values():
+        for n in ings:
+            if n not in names:
+                names.append(n)
+    if not names:
+        return
+    ids = _ensure_ingredients(names)
+    rows = [(did, ids[n]) for did, ings in links.items() for n in ings if n in ids]
+    execute_many('INSERT IGNORE INTO dish_ingredients (dish_id,ingredient_id) VALUES (%s,%s)', rows)
+
+    def apply():
+        for did, ings in links.items():
+            ingredient_index.link(did, [ids[n] for n in ings if n in ids])
+    after_commit(apply)
+
+
+def upsert_dishes(dishes, user_id=None, images='fill', reactivate=False, owner=None):
+    uniq = {}
+    for d in dishes:
+        name = (d.get('name') or '').strip()
+        if name:
+            uniq.setdefault(_key(name), dict(DEFAULTS, **{k: v for k, v in d.items() if v is not None and k != 'name'}, name=name))
+    report = {'ids': {}, 'created': 0, 'added': 0}
+    if not uniq:
+        return report
+    with transaction():
+        ids = {_key(r['name']): r['id'] for r in _in('SELECT id,name FROM dishes WHERE name IN ({})', [d['name'] for d in uniq.values()])}
+        new = [d for k, d in uniq.items() if k not in ids]
+        if new:
+            execute_many('INSERT INTO dishes (name,cuisine,time_min,difficulty,veg,spice_level,image_url,created_by) VALUES (%s,%s,%s,%s,%s,%s,%s,%s) ON DUPLICATE KEY UPDATE name=name',
+                         [(d['name'], d['cuisine'], d['time_min'], d['difficulty'], d['veg'], d['spice_level'], d.get('image_url') or PLACEHOLDER, owner) for d in new])
+            ids.update({_key(r['name']): r['id'] for r in _in('SELECT id,name FROM dishes WHERE name IN ({})', [d['name'] for d in new])})
+            report['created'] = len(new)
+        fresh = {_key(d['name']) for d in new}
+        updates = [(d['image_url'], ids[k]) for k, d in uniq.items() if k in ids and k not in fresh and d.get('image_url')]
+        if updates and images == 'replace' and user_id is not None:
+            execute_many('UPDATE dishes SET image_url=%s WHERE id=%s AND ' + IMAGE_OWNER_SQL, [u + (user_id, user_id) for u in updates])
+        elif updates and images == 'fill':
+            execute_many('UPDATE dishes SET image_url=%s WHERE id=%s AND (COALESCE(image_url,"")="" OR image_url=%s)', [u + (PLACEHOLDER,) for u in updates])
+        link_ingredients({ids[k]: [term(i) for i in d.get('ings') or ()] for k, d in uniq.items() if k in ids and d.get('ings')})
+        if user_id is not None:
+            dish_ids = [ids[k] for k in uniq if k in ids]
+            marks = ','.join(['%s'] * len(dish_ids))
+            active = ' AND active=1' if reactivate else ''
+            have = {r['dish_id'] for r in query(f'SELECT dish_id FROM user_library WHERE user_id=%s{active} AND dish_id IN ({marks})', [user_id] + dish_ids)}
+            added = [i for i in dish_ids if i not in have]
+            if added:
+                sql = 'INSERT INTO user_library (user_id,dish_id) VALUES (%s,%s) ON DUPLICATE KEY UPDATE active=1' if reactivate else 'INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)'
+                execute_many(sql, [(user_id, i) for i in added])
+                library_stats.dishes_added(user_id, added)
+            report['added'] = len(added)
+    report['ids'] = {uniq[k]['name']: ids[k] for k in uniq if k in ids}
+    return report
+
+
+def upsert_dish(d, user_id=None, images='fill', owner=None):
+    ids = upsert_dishes([d], user_id, images, owner=owner)['ids']
+    return next(iter(ids.values()), None)
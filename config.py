@@ -9,6 +9,61 @@ DB_PORT = int(os.getenv('DB_PORT','3306'))
 DB_NAME = os.getenv('DB_NAME','mealmind')
 DB_USER = os.getenv('DB_USER','root')
 DB_PASS = os.getenv('DB_PASS','')
+DB_BACKEND = os.getenv('DB_BACKEND','mysql').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mealmind.db'))
+SQLITE_MMAP = int(os.getenv('SQLITE_MMAP', str(256 * 1024 * 1024)))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE','256'))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT','5'))
 COOLDOWN_DAYS = int(os.getenv('COOLDOWN_DAYS','4'))
 SUGGESTION_TIME = os.getenv('SUGGESTION_TIME','19:00')
 DEV_ROTATE_SECONDS = int(os.getenv('DEV_ROTATE_SECONDS','0'))
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN','1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX','10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT','10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE','3600'))
+DB_POOL_IDLE = int(os.getenv('DB_POOL_IDLE','300'))
+DB_POOL_PING_IDLE = float(os.getenv('DB_POOL_PING_IDLE','10'))
+PREFS_CACHE_TTL = int(os.getenv('PREFS_CACHE_TTL','300'))
+PREFS_CACHE_SIZE = int(os.getenv('PREFS_CACHE_SIZE','4096'))
+SAMPLER_SEED = os.getenv('SAMPLER_SEED') or None
+SAMPLER_NEVER_COOKED_DAYS = int(os.getenv('SAMPLER_NEVER_COOKED_DAYS','30'))
+CANDIDATE_CACHE_TTL = int(os.getenv('CANDIDATE_CACHE_TTL','60'))
+MEALDB_BASE_URL = os.getenv('MEALDB_BASE_URL','https://www.themealdb.com/api/json/v1/1')
+MEALDB_TIMEOUT = float(os.getenv('MEALDB_TIMEOUT','6'))
+MEALDB_CACHE_DIR = os.getenv('MEALDB_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'mealdb'))
+MEALDB_CACHE_TTL = int(os.getenv('MEALDB_CACHE_TTL','86400'))
+MEALDB_CACHE_BUDGET = int(os.getenv('MEALDB_CACHE_BUDGET', str(64 << 20)))
+MEALDB_WORKERS = int(os.getenv('MEALDB_WORKERS','4'))
+OVERRIDE_DEADLINE_MS = int(os.getenv('OVERRIDE_DEADLINE_MS','2500'))
+OVERRIDE_PROGRESSIVE = os.getenv('OVERRIDE_PROGRESSIVE','0') == '1'
+OVERRIDE_WEB_WORKERS = int(os.getenv('OVERRIDE_WEB_WORKERS','16'))
+ASYNC_HTTP_CONNECTIONS = int(os.getenv('ASYNC_HTTP_CONNECTIONS','50'))
+ASYNC_DB_POOL_MAX = int(os.getenv('ASYNC_DB_POOL_MAX','20'))
+ASGI_SYNC_WORKERS = int(os.getenv('ASGI_SYNC_WORKERS','16'))
+ASGI_MAX_INFLIGHT = int(os.getenv('ASGI_MAX_INFLIGHT','32'))
+DISCOVER_MAX_AGE_HOURS = int(os.getenv('DISCOVER_MAX_AGE_HOURS','0'))
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED','0') == '1'
+SCHEDULER_INTERVAL = int(os.getenv('SCHEDULER_INTERVAL','60'))
+SCHEDULER_JITTER = int(os.getenv('SCHEDULER_JITTER','300'))
+SCHEDULER_STORE = os.getenv('SCHEDULER_STORE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'scheduler.json'))
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL','300'))
+IMPORT_BATCH = int(os.getenv('IMPORT_BATCH','500'))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS','20'))
+HISTORY_COUNT_TTL = int(os.getenv('HISTORY_COUNT_TTL','600'))
+NAME_FULLTEXT = os.getenv('NAME_FULLTEXT','0') == '1'
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS','2'))
+IMAGE_WEBP_METHOD = int(os.getenv('IMAGE_WEBP_METHOD','4'))
+IMG_PROXY_DIR = os.getenv('IMG_PROXY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'img'))
+IMG_PROXY_BUDGET = int(os.getenv('IMG_PROXY_BUDGET', str(256 << 20)))
+IMG_PROXY_MAX_AGE = int(os.getenv('IMG_PROXY_MAX_AGE', str(30 * 86400)))
+IMG_PROXY_HOSTS = [h.strip().lower() for h in os.getenv('IMG_PROXY_HOSTS', 'themealdb.com').split(',') if h.strip()]
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE','512'))
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL','600'))
+DEFAULT_USER_ID = None if os.getenv('DEFAULT_USER_ID','auto') == 'auto' else int(os.getenv('DEFAULT_USER_ID') or 0)
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL','300'))
+ADMIN_USER_IDS = {int(x) for x in os.getenv('ADMIN_USER_IDS','1').split(',') if x.strip()}
+METRICS_TOKEN = os.getenv('METRICS_TOKEN','')
+PLAN_LOCK_TIMEOUT = int(os.getenv('PLAN_LOCK_TIMEOUT','0'))
+PLAN_MAX_DAYS = int(os.getenv('PLAN_MAX_DAYS','56'))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS','0'))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN','1') in ('1','true','True','yes')
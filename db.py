@@ -1,28 +1,282 @@
+from contextlib import contextmanager
 from flask import g
+import sqlite3
+import threading
+import time
 import pymysql
+from pymysql.constants import SERVER_STATUS
 import config
+import profiler
+from dialect import SQLITE
+
+
+def _connect():
+    if SQLITE:
+        import sqlite_db
+        return sqlite_db.connect()
+    return pymysql.connect(host=config.DB_HOST, port=config.DB_PORT, user=config.DB_USER, password=config.DB_PASS, database=config.DB_NAME, cursorclass=pymysql.cursors.DictCursor, autocommit=True)
+
+
+DISCONNECT_ERRORS = sqlite3.ProgrammingError if SQLITE else pymysql.err.OperationalError
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Pool:
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10, recycle=3600, idle_timeout=300, ping_idle=10):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.idle_timeout = idle_timeout
+        self.ping_idle = ping_idle
+        self.cond = threading.Condition()
+        self.idle = []
+        self.size = 0
+        self.in_use = 0
+        self.stats = {'checkouts': 0, 'created': 0, 'recycled': 0, 'broken': 0, 'timeouts': 0, 'waits': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+
+    def _open(self):
+        conn = self.connect()
+        conn._pool_born = conn._pool_used = time.monotonic()
+        self.stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        self.size -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn):
+        now = time.monotonic()
+        if self.recycle and now - conn._pool_born > self.recycle:
+            self.stats['recycled'] += 1
+            return False
+        if now - conn._pool_used < self.ping_idle:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            self.stats['broken'] += 1
+            return False
+
+    def warm(self):
+        while self.size < self.min_size:
+            conn = self._open()
+            with self.cond:
+                self.size += 1
+                self.idle.append(conn)
+                self.cond.notify()
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            conn = None
+            with self.cond:
+                while not self.idle and self.size >= self.max_size:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(f'no connection available after {self.timeout}s ({self.size} open)')
+                    self.stats['waits'] += 1
+                    self.cond.wait(left)
+                if self.idle:
+                    conn = self.idle.pop()
+                else:
+                    self.size += 1
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self.cond:
+                        self.size -= 1
+                        self.cond.notify()
+                    raise
+                return self._checkout(conn, start)
+            if self._healthy(conn):
+                return self._checkout(conn, start)
+            with self.cond:
+                self._discard(conn)
+                self.cond.notify()
+
+    def _checkout(self, conn, start):
+        waited = time.monotonic() - start
+        with self.cond:
+            self.in_use += 1
+            self.stats['checkouts'] += 1
+            self.stats['wait_total'] += waited
+            self.stats['wait_max'] = max(self.stats['wait_max'], waited)
+        return conn
+
+    def release(self, conn, broken=False):
+        if not broken and conn.open:
+            try:
+                if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    conn.rollback()
+            except Exception:
+                broken = True
+        with self.cond:
+            self.in_use -= 1
+            if broken or not conn.open:
+                self._discard(conn)
+            else:
+                conn._pool_used = time.monotonic()
+                self.idle.append(conn)
+            self.cond.notify()
+
+    def reap(self):
+        now = time.monotonic()
+        with self.cond:
+            keep = []
+            for conn in self.idle:
+                if len(keep) + self.in_use >= self.min_size and now - conn._pool_used > self.idle_timeout:
+                    self.stats['recycled'] += 1
+                    self._discard(conn)
+                else:
+                    keep.append(conn)
+            self.idle = keep
+
+    def snapshot(self):
+        with self.cond:
+            s = dict(self.stats)
+            s.update(size=self.size, idle=len(self.idle), in_use=self.in_use, min_size=self.min_size, max_size=self.max_size)
+        s['wait_avg'] = s['wait_total'] / s['checkouts'] if s['checkouts'] else 0.0
+        return s
+
+
+pool = Pool(_connect, min_size=config.DB_POOL_MIN, max_size=config.DB_POOL_MAX, timeout=config.DB_POOL_TIMEOUT, recycle=config.DB_POOL_RECYCLE, idle_timeout=config.DB_POOL_IDLE, ping_idle=config.DB_POOL_PING_IDLE)
+
+
+def pool_stats():
+    return pool.snapshot()
+
 
 def get_db():
     if 'db' not in g:
-        g.db = pymysql.connect(host=config.DB_HOST, port=config.DB_PORT, user=config.DB_USER, password=config.DB_PASS, database=config.DB_NAME, cursorclass=pymysql.cursors.DictCursor, autocommit=True)
+        g.db = pool.acquire()
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        pool.release(db, broken=isinstance(e, DISCONNECT_ERRORS))
+        pool.reap()
+
+def _run(cur, sql, params, many=False):
+    start = time.perf_counter()
+    n = cur.executemany(sql, params) if many else cur.execute(sql, params or ())
+    rows = cur.rowcount if cur.description and not many else 0
+    profiler.db_call(cur.connection, sql, params, time.perf_counter() - start, max(rows, 0), many)
+    return n
 
 def query(sql, params=None, one=False):
     db = get_db()
     with db.cursor() as cur:
-        cur.execute(sql, params or ())
+        _run(cur, sql, params)
         if cur.description:
             rows = cur.fetchall()
+            if SQLITE:
+                profiler.add('db', 0.0, calls=0, rows=len(rows))
             return (rows[0] if rows else None) if one else rows
         return None
 
 def execute(sql, params=None):
     db = get_db()
     with db.cursor() as cur:
-        cur.execute(sql, params or ())
+        _run(cur, sql, params)
         return cur.lastrowid
+
+def stream(sql, params=None, size=500):
+    conn = pool.acquire()
+    broken = False
+    try:
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cur:
+            start = time.perf_counter()
+            cur.execute(sql, params or ())
+            fetched = 0
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                fetched += len(rows)
+                yield from rows
+            profiler.db_call(None, sql, params, time.perf_counter() - start, fetched)
+    except BaseException:
+        broken = True
+        raise
+    finally:
+        pool.release(conn, broken=broken)
+
+def execute_rowcount(sql, params=None):
+    db = get_db()
+    with db.cursor() as cur:
+        return _run(cur, sql, params)
+
+def execute_many(sql, seq):
+    seq = list(seq)
+    if not seq:
+        return 0
+    db = get_db()
+    with db.cursor() as cur:
+        return _run(cur, sql, seq, many=True)
+
+@contextmanager
+def transaction():
+    db = get_db()
+    depth = g.get('_tx_depth', 0)
+    g._tx_depth = depth + 1
+    if depth:
+        try:
+            yield db
+        finally:
+            g._tx_depth = depth
+        return
+    db.begin()
+    g._after_commit = []
+    try:
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        g.pop('_after_commit', None)
+        raise
+    finally:
+        g._tx_depth = depth
+    for fn in g.pop('_after_commit', ()):
+        fn()
+
+
+def after_commit(fn):
+    if g.get('_tx_depth', 0):
+        g._after_commit.append(fn)
+    else:
+        fn()
+
+
+_local_locks = [threading.Lock() for _ in range(64)]
+
+
+@contextmanager
+def advisory_lock(name, timeout=5):
+    if SQLITE:
+        lock = _local_locks[hash(name) % len(_local_locks)]
+        got = lock.acquire(timeout=timeout)
+        try:
+            yield got
+        finally:
+            if got:
+                lock.release()
+        return
+    got = query('SELECT GET_LOCK(%s,%s) ok', (name, timeout), one=True)['ok']
+    try:
+        yield bool(got)
+    finally:
+        if got:
+            query('SELECT RELEASE_LOCK(%s) ok', (name,), one=True)
@@ -0,0 +1,30 @@
+from functools import lru_cache
+import re
+import config
+
+SQLITE = config.DB_BACKEND == 'sqlite'
+
+_DQUOTE = re.compile(r'"([^"\']*)"')
+_IGNORE = re.compile(r'\bINSERT\s+IGNORE\b', re.I)
+_UPSERT = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.I)
+_VALUES = re.compile(r'\bVALUES\((\w+)\)', re.I)
+_GROUP_CONCAT = re.compile(r'\bGROUP_CONCAT\((.+?)\s+ORDER\s+BY\s+.+?\s+SEPARATOR\s+(\'[^\']*\')\)', re.I)
+_DATE_FORMAT = re.compile(r'\bDATE_FORMAT\(([^,]+),\s*(\'[^\']*\')\)', re.I)
+_FOR_UPDATE = re.compile(r'\s+FOR\s+UPDATE\b', re.I)
+_RAND = re.compile(r'\bRAND\(\)', re.I)
+_EXPLAIN = re.compile(r'^\s*EXPLAIN\b', re.I)
+
+
+@lru_cache(maxsize=1024)
+def to_sqlite(sql):
+    sql = _DQUOTE.sub(r"'\1'", sql)
+    sql = _IGNORE.sub('INSERT OR IGNORE', sql)
+    m = _UPSERT.search(sql)
+    if m:
+        sql = sql[:m.start()] + 'ON CONFLICT DO UPDATE SET' + _VALUES.sub(r'excluded.\1', sql[m.end():])
+    sql = _GROUP_CONCAT.sub(r'GROUP_CONCAT(\1, \2)', sql)
+    sql = _DATE_FORMAT.sub(r'strftime(\2, \1)', sql)
+    sql = _FOR_UPDATE.sub('', sql)
+    sql = _RAND.sub('RANDOM()', sql)
+    sql = _EXPLAIN.sub('EXPLAIN QUERY PLAN', sql)
+    return sql.replace('%s', '?').replace('%%', '%')
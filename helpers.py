@@ -1,12 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, g, has_app_context
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import contextvars
+import threading
+import time
 from datetime import date, timedelta, datetime
-from db import query, execute
-import uuid
-from PIL import Image
+from contextlib import contextmanager
+from db import query, execute, execute_rowcount, execute_many, transaction, advisory_lock
+import adb
+from dialect import SQLITE
+from cache import TTLCache, SingleFlight
+from sampler import AliasTable, rng
+import config
 import re
-import requests
+from mealdb import client as mealdb
 import random
-from difflib import get_close_matches
+from ingredient_index import index as ingredient_index
+import respcache
+import library_stats
+from normalize import normalize_tokens, ingredient_terms_from_text, aliases as _aliases
+from catalog import upsert_dishes, upsert_dish
 
 def _name_key(s):
     return re.sub(r'\s+', ' ', (s or '').strip().lower())
@@ -36,51 +49,43 @@ def combine_override_results(raw, lib, web):
     return out
 
 
-def web_find_recipes(raw):
-    q = raw.replace('+',' ').replace('|',' ').replace('-',' ').strip()
-    out = []
-    try:
-        r = requests.get('https://www.themealdb.com/api/json/v1/1/search.php', params={'s': q}, timeout=6)
-        j = r.json() if r.status_code==200 else {}
-        meals = j.get('meals') or []
-        for m in meals:
-            area = (m.get('strArea') or '')
-            if area not in ['Pakistani','Indian','Bangladeshi','Afghan','Middle Eastern','Arabic','Unknown']:
-                continue
-            out.append({
-                'id': int(m.get('idMeal')),
-                'name': m.get('strMeal'),
-                'cuisine': area or '—',
-                'time_min': 40,
-                'difficulty': 'Medium',
-                'veg': 0,
-                'spice_level': 'Medium',
-                'image_url': m.get('strMealThumb'),
-                'external': True,
-                'source_url': m.get('strSource') or f"https://www.themealdb.com/meal/{m.get('idMeal')}"
-            })
-        if not out:
-            toks = [t for t in re.split(r'[\s\+\|\-]+', q.lower()) if t]
-            best = toks[0] if toks else 'dal'
-            r = requests.get('https://www.themealdb.com/api/json/v1/1/search.php', params={'s': best}, timeout=6)
-            j = r.json() if r.status_code==200 else {}
-            meals = j.get('meals') or []
-            for m in meals[:8]:
-                area = (m.get('strArea') or '')
-                out.append({
-                    'id': int(m.get('idMeal')),
-                    'name': m.get('strMeal'),
-                    'cuisine': area or '—',
-                    'time_min': 40,
-                    'difficulty': 'Medium',
-                    'veg': 0,
-                    'spice_level': 'Medium',
-                    'image_url': m.get('strMealThumb'),
-                    'external': True,
-                    'source_url': m.get('strSource') or f"https://www.themealdb.com/meal/{m.get('idMeal')}"
-                })
-    except Exception:
-        return []
+def _web_item(m, area):
+    return {
+        'id': int(m.get('idMeal')),
+        'name': m.get('strMeal'),
+        'cuisine': area or '—',
+        'time_min': 40,
+        'difficulty': 'Medium',
+        'veg': 0,
+        'spice_level': 'Medium',
+        'image_url': m.get('strMealThumb'),
+        'ingredients': ', '.join(x.strip() for x in (m.get(f'strIngredient{i}') for i in range(1, 21)) if x and x.strip()),
+        'external': True,
+        'source_url': m.get('strSource') or f"https://www.themealdb.com/meal/{m.get('idMeal')}"
+    }
+
+
+WEB_AREAS = ('Pakistani','Indian','Bangladeshi','Afghan','Middle Eastern','Arabic','Unknown')
+
+
+def _web_query(raw):
+    return raw.replace('+',' ').replace('|',' ').replace('-',' ').strip()
+
+
+def _web_fallback_term(q):
+    toks = [t for t in re.split(r'[\s\+\|\-]+', q.lower()) if t]
+    return toks[0] if toks else 'dal'
+
+
+def _web_matches(meals):
+    return [_web_item(m, m.get('strArea')) for m in meals if (m.get('strArea') or '') in WEB_AREAS]
+
+
+def _web_fallback(meals):
+    return [_web_item(m, m.get('strArea') or '') for m in meals[:8]]
+
+
+def _dedupe_web(out):
     names = set()
     dedup = []
     for r in out:
@@ -89,304 +94,459 @@ def web_find_recipes(raw):
     return dedup[:10]
 
 
-def resolve_ingredient_ids(tokens):
-    if not tokens:
-        return {}
-    names = [t for t in tokens]
-    rows = query('SELECT id,name FROM ingredients WHERE name IN ('+','.join(['%s']*len(names))+')', names)
-    known = {r['name']: r['id'] for r in rows}
-    if len(known) == len(tokens):
-        return {t: known[t] for t in tokens}
-    all_names = [r['name'] for r in query('SELECT name FROM ingredients')]
-    resolved = {}
-    for t in tokens:
-        if t in known:
-            resolved[t] = known[t]
-            continue
-        cand = get_close_matches(t, all_names, n=1, cutoff=0.8)
-        if cand:
-            rid = query('SELECT id FROM ingredients WHERE name=%s', (cand[0],), one=True)['id']
-            resolved[t] = rid
-    return resolved
+def web_find_recipes(raw):
+    q = _web_query(raw)
+    try:
+        out = _web_matches(mealdb.search(q)) or _web_fallback(mealdb.search(_web_fallback_term(q)))
+    except Exception:
+        return []
+    return _dedupe_web(out)
 
 
-def dish_name_hits(raw):
-    raw = raw.strip()
-    if not raw:
+async def aweb_find_recipes(raw):
+    q = _web_query(raw)
+    try:
+        out = _web_matches(await mealdb.asearch(q)) or _web_fallback(await mealdb.asearch(_web_fallback_term(q)))
+    except Exception:
         return []
-    rows = list(query(
-        'SELECT id,name,cuisine,time_min,difficulty,veg,spice_level,image_url '
-        'FROM dishes WHERE name LIKE %s '
-        'ORDER BY CASE WHEN name=%s THEN 0 ELSE 1 END, LENGTH(name) ASC LIMIT 5',
-        (f'%{raw}%', raw)
-    ))
-    for r in rows:
-        r['score'] = 999
-        r['hit_labels'] = ['name match']
-    return rows
+    return _dedupe_web(out)
+
+
+_web_pool = ThreadPoolExecutor(max_workers=config.OVERRIDE_WEB_WORKERS, thread_name_prefix='override-web')
+
+
+def _submit_web(raw):
+    return _web_pool.submit(contextvars.copy_context().run, web_find_recipes, raw)
+
+
+def _web_result(fut, deadline_at):
+    try:
+        return fut.result(timeout=None if deadline_at is None else max(deadline_at - time.monotonic(), 0)), False
+    except FutureTimeout:
+        return [], True
+
+
+def _deadline():
+    return time.monotonic() + config.OVERRIDE_DEADLINE_MS / 1000 if config.OVERRIDE_DEADLINE_MS else None
+
+
+def override_search(raw):
+    deadline_at = _deadline()
+    web = _submit_web(raw)
+    lib = match_dishes(raw)
+    return (lib, *_web_result(web, deadline_at))
+
+
+def override_web(raw):
+    return _web_result(_submit_web(raw), _deadline())
+
+
+def prefetch_web(raw):
+    _submit_web(raw)
+
+
+_web_tasks = set()
+
+
+def _spawn_web(raw):
+    task = asyncio.ensure_future(aweb_find_recipes(raw))
+    _web_tasks.add(task)
+    task.add_done_callback(_web_tasks.discard)
+    return task
+
 
+async def _aweb_result(task, deadline_at):
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), None if deadline_at is None else max(deadline_at - time.monotonic(), 0)), False
+    except asyncio.TimeoutError:
+        return [], True
+
+
+async def aoverride_search(raw):
+    deadline_at = _deadline()
+    web = _spawn_web(raw)
+    lib = await amatch_dishes(raw)
+    return (lib, *await _aweb_result(web, deadline_at))
+
+
+async def aoverride_web(raw):
+    await _aliases.aensure()
+    return await _aweb_result(_spawn_web(raw), _deadline())
+
+
+def aprefetch_web(raw):
+    _spawn_web(raw)
 
-def _center_crop_ratio(img, rw=16, rh=9):
-    w, h = img.size
-    tr = rw / rh
-    cr = w / h
-    if cr > tr:
-        nw = int(h * tr)
-        x = (w - nw) // 2
-        return img.crop((x, 0, x + nw, h))
-    nh = int(w / tr)
-    y = (h - nh) // 2
-    return img.crop((0, y, w, y + nh))
 
+_prefs_cache = TTLCache(maxsize=config.PREFS_CACHE_SIZE, ttl=config.PREFS_CACHE_TTL)
+_pref_filters = TTLCache(maxsize=config.PREFS_CACHE_SIZE, ttl=config.PREFS_CACHE_TTL)
 
-def save_image(fileobj, w=1280, h=720):
-    img = Image.open(fileobj.stream)
-    if img.mode not in ('RGB', 'L'):
-        img = img.convert('RGB')
-    img = _center_crop_ratio(img, 16, 9).resize((w, h), Image.LANCZOS)
-    name = f"{uuid.uuid4().hex}.webp"
-    path = os.path.join(UPLOAD_DIR, name)
-    img.save(path, format='WEBP', quality=85, method=6)
-    return f"/static/uploads/{name}"
+
+def _request_memo(name):
+    if not has_app_context():
+        return {}
+    memo = g.get(name)
+    if memo is None:
+        memo = {}
+        setattr(g, name, memo)
+    return memo
+
+
+def _prefs_key(user_id):
+    return user_id, respcache.data_version(user_id)[0]
 
 
 def get_prefs(user_id=1):
-    row = query('SELECT * FROM preferences WHERE user_id=%s', (user_id,), one=True)
-    if not row:
-        execute('INSERT INTO preferences (user_id) VALUES (%s)', (user_id,))
-        row = query('SELECT * FROM preferences WHERE user_id=%s', (user_id,), one=True)
+    memo = _request_memo('_prefs')
+    row = memo.get(user_id)
+    if row is None:
+        key = _prefs_key(user_id)
+        row = _prefs_cache.get(key)
+        if row is None:
+            row = query('SELECT * FROM preferences WHERE user_id=%s', (user_id,), one=True)
+            if not row:
+                execute('INSERT INTO preferences (user_id) VALUES (%s)', (user_id,))
+                row = query('SELECT * FROM preferences WHERE user_id=%s', (user_id,), one=True)
+            _prefs_cache.set(key, row)
+    memo[user_id] = row
     return row
 
 
+def invalidate_prefs(user_id=1):
+    _request_memo('_prefs').pop(user_id, None)
+
+
+def invalidate_user(user_id=1):
+    invalidate_prefs(user_id)
+    _candidate_pools.pop((user_id, date.today()))
+    _catalog_pools.pop(user_id)
+    respcache.bump(user_id)
+
+
 def get_cooldown_days(user_id=1):
     prefs = get_prefs(user_id)
     d = prefs.get('cooldown_days') or config.COOLDOWN_DAYS
     return int(d)
 
 
+_candidate_pools = TTLCache(maxsize=config.PREFS_CACHE_SIZE, ttl=config.CANDIDATE_CACHE_TTL)
+_catalog_pools = TTLCache(maxsize=config.PREFS_CACHE_SIZE, ttl=config.CANDIDATE_CACHE_TTL)
+
+
+def _cook_weight(r, today):
+    lc = r.get('last_cooked_at')
+    return config.SAMPLER_NEVER_COOKED_DAYS if lc is None else max((today - lc).days, 0) + 1
+
+
+class CandidatePool:
+    def __init__(self, rows, today):
+        fresh = [r for r in rows if not r['cooling']]
+        self.fresh = AliasTable([r['id'] for r in fresh], [_cook_weight(r, today) for r in fresh])
+        self.all = AliasTable([r['id'] for r in rows], [_cook_weight(r, today) for r in rows])
+
+    def sample(self, k, exclude=()):
+        ids = self.fresh.sample(k, exclude)
+        if len(ids) < k:
+            ids += self.all.sample(k - len(ids), tuple(exclude) + tuple(ids))
+        return ids
+
+
+def candidate_pool(user_id=1):
+    today = date.today()
+    pool = _candidate_pools.get((user_id, today))
+    if pool is None:
+        cd = get_cooldown_days(user_id)
+        pf_sql, pf_params = pref_filter_sql(user_id)
+        rows = query('SELECT d.id, ul.last_cooked_at, '
+                     'EXISTS(SELECT 1 FROM day_plan dp WHERE dp.user_id=ul.user_id AND dp.dish_id=d.id AND dp.date>=%s) AS cooling '
+                     'FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1' + pf_sql,
+                     [today - timedelta(days=cd), user_id] + pf_params)
+        pool = CandidatePool(rows, today)
+        _candidate_pools.set((user_id, today), pool)
+    return pool
+
+
+def library_rows(user_id, ids):
+    if not ids:
+        return []
+    rows = query('SELECT d.*, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND d.id IN (' + ','.join(['%s']*len(ids)) + ')', [user_id] + list(ids))
+    by_id = {r['id']: r for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+_pick_flight = SingleFlight()
+
+
 def pick_candidate(user_id=1):
+    def pick():
+        rows = library_rows(user_id, candidate_pool(user_id).sample(1))
+        return rows[0] if rows else None
+    return _pick_flight.do(('pick', user_id), pick)
+
+
+_history_counts = TTLCache(maxsize=config.PREFS_CACHE_SIZE, ttl=config.HISTORY_COUNT_TTL)
+_history_lock = threading.Lock()
+
+
+def history_count(user_id, key, compute):
+    ck = (user_id, date.today())
+    counts = _history_counts.get(ck)
+    if counts is not None and key in counts:
+        return counts[key]
+    n = compute()
+    with _history_lock:
+        _history_counts.set(ck, {**(_history_counts.get(ck) or {}), key: n})
+    return n
+
+
+def _adjust_history_counts(user_id, d, inserted, is_override):
     today = date.today()
-    cd = get_cooldown_days(user_id)
-    pf_sql, pf_params = pref_filter_sql(user_id)
-    params = [user_id, user_id, today - timedelta(days=cd)] + pf_params
-    rows = query('SELECT d.*, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1 AND d.id NOT IN (SELECT dish_id FROM day_plan WHERE user_id=%s AND date >= %s)' + pf_sql, params)
-    if not rows:
-        params = [user_id] + pf_params
-        rows = query('SELECT d.*, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1' + pf_sql, params)
-    if not rows:
-        return None
-    def score(r):
-        lc = r.get('last_cooked_at')
-        base = 0 if lc is None else (today - lc).days
-        return base + random.random()
-    rows.sort(key=score, reverse=True)
-    return rows[0]
+    with _history_lock:
+        counts = _history_counts.get((user_id, today))
+        if not counts:
+            return
+        if d != today:
+            _history_counts.pop((user_id, today))
+            return
+        typ_now = 'override' if is_override else 'cooked'
+        kept = {}
+        for (period, typ, q), c in counts.items():
+            if q or (not inserted and typ != 'all'):
+                continue
+            kept[(period, typ, q)] = c + 1 if inserted and period != 'yesterday' and typ in ('all', typ_now) else c
+        _history_counts.set((user_id, today), kept)
+
+
+def record_plan(user_id, d, dish_id, is_override=0, cooked=True):
+    n = execute_rowcount('INSERT IGNORE INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,%s)', (user_id, d, dish_id, is_override))
+    if not n:
+        n = 2 if execute_rowcount('UPDATE day_plan SET dish_id=%s, is_override=%s WHERE user_id=%s AND date=%s AND (dish_id<>%s OR is_override<>%s)', (dish_id, is_override, user_id, d, dish_id, is_override)) else 0
+    if cooked:
+        execute('UPDATE user_library SET last_cooked_at=%s WHERE user_id=%s AND dish_id=%s', (d, user_id, dish_id))
+    if n:
+        _adjust_history_counts(user_id, d, n == 1, is_override)
+    if n == 1:
+        library_stats.plan_added(user_id, d)
+    invalidate_user(user_id)
+    return n
+
+
+def add_to_library(user_id, dish_id):
+    n = execute_rowcount('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (user_id, dish_id))
+    if n:
+        library_stats.dishes_added(user_id, [dish_id])
+    return n
+
+
+FULLTEXT_INDEX_SQL = "SELECT 1 AS ok FROM information_schema.statistics WHERE table_schema=DATABASE() AND table_name='dishes' AND index_name='ft_dishes_name' LIMIT 1"
+_fulltext = {}
+
+
+def _fulltext_ready():
+    if 'ready' not in _fulltext:
+        _fulltext['ready'] = bool(query(FULLTEXT_INDEX_SQL, one=True))
+    return _fulltext['ready']
+
+
+def name_search_sql(q, col='d.name'):
+    term = q.replace('"', ' ').strip()
+    if config.NAME_FULLTEXT and not SQLITE and len(term) >= 2 and _fulltext_ready():
+        return f'MATCH({col}) AGAINST (%s IN BOOLEAN MODE)', f'"{term}"'
+    return f'{col} LIKE %s', f'%{q}%'
+
+
+PLAN_SQL = 'SELECT d.*, dp.is_override FROM day_plan dp JOIN dishes d ON d.id=dp.dish_id WHERE dp.user_id=%s AND dp.date=%s'
+
+
+@contextmanager
+def plan_lock(user_id, d):
+    if not config.PLAN_LOCK_TIMEOUT:
+        yield False
+        return
+    with advisory_lock(f'mealmind:plan:{user_id}:{d}', config.PLAN_LOCK_TIMEOUT) as got:
+        yield got
+
+
+def claim_plan(user_id, d, dish_id):
+    n = execute_rowcount('INSERT IGNORE INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,0)', (user_id, d, dish_id))
+    if n:
+        _adjust_history_counts(user_id, d, True, 0)
+        library_stats.plan_added(user_id, d)
+        invalidate_user(user_id)
+    return query(PLAN_SQL, (user_id, d), one=True)
+
+
+def _create_today_plan(user_id, d, cand=None):
+    if not get_prefs(user_id).get('auto_suggestions', 1):
+        return cand or pick_candidate(user_id)
+    with plan_lock(user_id, d):
+        existing = query(PLAN_SQL, (user_id, d), one=True)
+        if existing:
+            return existing
+        cand = cand or pick_candidate(user_id)
+        return claim_plan(user_id, d, cand['id']) if cand else None
+
+
+def create_today_plan(user_id, d, cand=None):
+    return _pick_flight.do(('plan', user_id, d), lambda: _create_today_plan(user_id, d, cand))
 
 
 def get_or_create_today_plan(user_id=1):
     today_d = date.today()
-    existing = query('SELECT d.*, dp.is_override FROM day_plan dp JOIN dishes d ON d.id=dp.dish_id WHERE dp.user_id=%s AND dp.date=%s', (user_id, today_d), one=True)
+    existing = query(PLAN_SQL, (user_id, today_d), one=True)
     if existing:
         return existing
-    prefs = get_prefs(user_id)
-    if prefs.get('auto_suggestions', 1):
-        cand = pick_candidate(user_id)
-        if cand:
-            execute('INSERT INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,0) ON DUPLICATE KEY UPDATE dish_id=VALUES(dish_id), is_override=0', (user_id, today_d, cand['id']))
-            return query('SELECT d.*, dp.is_override FROM day_plan dp JOIN dishes d ON d.id=dp.dish_id WHERE dp.user_id=%s AND dp.date=%s', (user_id, today_d), one=True)
-    return pick_candidate(user_id)
+    return create_today_plan(user_id, today_d)
 
 
 def alt_picks(exclude_id, user_id=1, limit=3):
-    today = date.today()
-    cd = get_cooldown_days(user_id)
-    pf_sql, pf_params = pref_filter_sql(user_id)
-
-    base = ('SELECT d.id,d.name,d.cuisine,d.time_min,d.image_url,ul.last_cooked_at,ul.created_at '
-            'FROM user_library ul JOIN dishes d ON d.id=ul.dish_id '
-            'WHERE ul.user_id=%s AND ul.active=1 AND d.id<>%s ')
-
-    sql_cd = (base + 'AND d.id NOT IN (SELECT dish_id FROM day_plan WHERE user_id=%s AND date>=%s) ' + pf_sql +
-              ' ORDER BY (ul.last_cooked_at IS NULL) DESC, '
-              'COALESCE(ul.last_cooked_at, "1970-01-01") ASC, '
-              'COALESCE(ul.created_at, "1970-01-01") DESC, '
-              'RAND() LIMIT %s')
-    rows = query(sql_cd, [user_id, exclude_id, user_id, today - timedelta(days=cd)] + pf_params + [limit*2])
-
-    if len(rows) < limit:
-        sql_loose = (base + pf_sql +
-                     ' ORDER BY (ul.last_cooked_at IS NULL) DESC, '
-                     'COALESCE(ul.last_cooked_at, "1970-01-01") ASC, '
-                     'COALESCE(ul.created_at, "1970-01-01") DESC, '
-                     'RAND() LIMIT %s')
-        rows = query(sql_loose, [user_id, exclude_id] + pf_params + [limit*2])
-
-    out, seen = [], set()
-    for r in rows:
-        if r['id'] in seen: 
-            continue
-        seen.add(r['id'])
-        out.append({
-            'id': r['id'],
-            'name': r['name'],
-            'cuisine': r['cuisine'],
-            'time_min': r['time_min'] or 0,
-            'image_url': r['image_url'],
-            'is_web': 0
-        })
-        if len(out) == limit:
-            break
-
+    rows = library_rows(user_id, candidate_pool(user_id).sample(limit, exclude=(exclude_id,)))
+    out = [_alt_item(r) for r in rows]
     if len(out) < limit:
-        for w in discover_candidates(user_id, limit - len(out)):
-            out.append({
-                'id': None,
-                'name': w['name'],
-                'cuisine': w.get('cuisine'),
-                'time_min': w.get('time_min') or 0,
-                'image_url': w.get('image_url'),
-                'is_web': 1,
-                'df_id': w['id']
-            })
+        out.extend(_web_alt_item(w) for w in discover_candidates(user_id, limit - len(out)))
     return out
 
 
-def normalize_tokens(s):
-    s = s.lower().strip()
-    s = s.replace(',', ' ')
-    s = s.replace('/', ' | ')
-    s = re.sub(r'\band\b', '+', s)
-    s = re.sub(r'\bor\b', '|', s)
-    s = re.sub(r'\s+', ' ', s)
-    s = re.sub(r'([+\-|])', r' \1 ', s).strip()
-    parts = [p for p in s.split() if p]
-    op = '+'
-    required, optional, excluded = [], [], []
-    for p in parts:
-        if p in ['+','|','-']:
-            op = p
-            continue
-        if p.endswith('s') and len(p) > 3:
-            p = p[:-1]
-        aliases = {
-            'chkn':'chicken','chikn':'chicken','chk':'chicken','murghi':'chicken',
-            'qeema':'keema','keema':'keema',
-            'aloo':'potato','bhindi':'okra','saag':'spinach','machli':'fish',
-            'dal':'dal','daal':'dal','dāl':'dal',
-            'masoor':'masoor dal','moong':'moong dal','chanadal':'chana dal','chana':'chana dal','mash':'urad dal','urad':'urad dal',
-            'chawal':'rice','chāwal':'rice'
-        }
-
-        p = aliases.get(p, p)
-        if op == '-':
-            excluded.append(p)
-        elif op == '|':
-            optional.append(p)
-        else:
-            required.append(p)
-    return required, optional, excluded
+def _alt_item(r):
+    return {
+        'id': r['id'],
+        'name': r['name'],
+        'cuisine': r['cuisine'],
+        'time_min': r['time_min'] or 0,
+        'image_url': r['image_url'],
+        'is_web': 0
+    }
+
+
+def _web_alt_item(w):
+    return {
+        'id': None,
+        'name': w['name'],
+        'cuisine': w.get('cuisine'),
+        'time_min': w.get('time_min') or 0,
+        'image_url': w.get('image_url'),
+        'is_web': 1,
+        'df_id': w['id']
+    }
+
+
+def today_bundle(user_id=1, alt_limit=3, recent_limit=6, force=False):
+    today = date.today()
+    cd = get_cooldown_days(user_id)
+    recent = query('SELECT d.*, dp.date AS cooked_date, dp.is_override FROM day_plan dp JOIN dishes d ON d.id=dp.dish_id WHERE dp.user_id=%s AND dp.date<=%s ORDER BY dp.date DESC LIMIT %s', (user_id, today, recent_limit))
+    pool = candidate_pool(user_id)
+
+    pick = None
+    if recent and recent[0]['cooked_date'] == today and not force:
+        pick = {k: v for k, v in recent[0].items() if k != 'cooked_date'}
+        rows = library_rows(user_id, pool.sample(alt_limit, exclude=(pick['id'],)))
+    else:
+        pid = pool.sample(1)
+        rows = library_rows(user_id, pid + pool.sample(alt_limit, exclude=pid))
+        cand = rows.pop(0) if rows and rows[0]['id'] in pid else None
+        pick = cand
+        if cand and not force and get_prefs(user_id).get('auto_suggestions', 1):
+            pick = create_today_plan(user_id, today, cand) or cand
+            rows = [r for r in rows if r['id'] != pick['id']]
+            if recent and recent[0]['cooked_date'] == today:
+                recent = recent[1:]
+            recent = ([dict(pick, cooked_date=today)] + recent)[:recent_limit]
+
+    alts = []
+    if pick:
+        alts = [_alt_item(r) for r in rows][:alt_limit]
+        if len(alts) < alt_limit:
+            alts.extend(_web_alt_item(w) for w in discover_candidates(user_id, alt_limit - len(alts)))
+    return {'pick': pick, 'alts': alts, 'recent': recent, 'cooldown': cd}
 
 
 def resolve_ingredient_ids(tokens):
     if not tokens:
         return {}
-    names = [t for t in tokens]
-    rows = query('SELECT id,name FROM ingredients WHERE name IN ('+','.join(['%s']*len(names))+')', names)
-    known = {r['name']: r['id'] for r in rows}
-    if len(known) == len(tokens):
-        return {t: known[t] for t in tokens}
-    all_names = [r['name'] for r in query('SELECT name FROM ingredients')]
-    resolved = {}
-    for t in tokens:
-        if t in known:
-            resolved[t] = known[t]
-            continue
-        cand = get_close_matches(t, all_names, n=1, cutoff=0.8)
-        if cand:
-            rid = query('SELECT id FROM ingredients WHERE name=%s', (cand[0],), one=True)['id']
-            resolved[t] = rid
-    return resolved
+    return ingredient_index.ensure().resolve(tokens)
 
 
-def dish_name_hits(raw):
-    raw = raw.strip()
-    if not raw:
-        return []
-    rows = query('SELECT id,name,cuisine,time_min,difficulty,veg,spice_level,image_url FROM dishes WHERE name LIKE %s ORDER BY CASE WHEN name=%s THEN 0 ELSE 1 END, LENGTH(name) ASC LIMIT 5', (f'%{raw}%', raw))
+DISH_COLS = 'SELECT id,name,cuisine,time_min,difficulty,veg,spice_level,image_url FROM dishes'
+NAME_HITS_SQL = DISH_COLS + ' WHERE name LIKE %s ORDER BY CASE WHEN name=%s THEN 0 ELSE 1 END, LENGTH(name) ASC LIMIT 5'
+
+
+def _name_hits(rows):
     for r in rows:
         r['score'] = 999
         r['hit_labels'] = ['name match']
     return rows
 
 
-def match_dishes(raw):
+def dish_name_hits(raw):
+    raw = raw.strip()
+    if not raw:
+        return []
+    return _name_hits(query(NAME_HITS_SQL, (f'%{raw}%', raw)))
+
+
+async def adish_name_hits(raw):
+    raw = raw.strip()
+    if not raw:
+        return []
+    return _name_hits(await adb.query(NAME_HITS_SQL, (f'%{raw}%', raw)))
+
+
+def _match_scores(idx, raw):
     req, opt, ex = normalize_tokens(raw)
-    rid = resolve_ingredient_ids(req)
-    oid = resolve_ingredient_ids(opt)
-    xid = resolve_ingredient_ids(ex)
-    req_ids = set(rid.values())
-    opt_ids = set(oid.values())
-    ex_ids = set(xid.values())
-    all_ids = list(req_ids | opt_ids | ex_ids)
+    req_ids = set(idx.resolve(req).values())
+    opt_ids = set(idx.resolve(opt).values())
+    ex_ids = set(idx.resolve(ex).values())
+    if not (req_ids | opt_ids):
+        return {}
 
-    hits = list(dish_name_hits(raw))  # force list
+    cand = idx.dishes_with_all(req_ids) if req_ids else idx.dishes_with_any(opt_ids)
+    if ex_ids:
+        cand -= idx.dishes_with_any(ex_ids)
 
-    if not all_ids:
-        return hits
+    scored = {}
+    for did in cand:
+        ids = idx.ingredients_of(did)
+        scored[did] = (len(req_ids)*2 + len(opt_ids & ids), sorted((req_ids | opt_ids) & ids))
+    return scored
 
-    placeholders = ','.join(['%s']*len(all_ids))
-    rows = query(f'''
-        SELECT d.id,d.name,d.cuisine,d.time_min,d.difficulty,d.veg,d.spice_level,d.image_url,
-               GROUP_CONCAT(i.id) AS hit_ids,
-               GROUP_CONCAT(i.name) AS hit_names
-        FROM dishes d
-        JOIN dish_ingredients di ON di.dish_id=d.id
-        JOIN ingredients i ON i.id=di.ingredient_id
-        WHERE di.ingredient_id IN ({placeholders})
-        GROUP BY d.id
-    ''', all_ids)
 
-    out, seen = [], set()
+def _rank_matches(idx, scored, rows, hits):
+    out = []
     for r in rows:
-        ids = set(map(int, r['hit_ids'].split(','))) if r['hit_ids'] else set()
-        if ex_ids & ids:
-            continue
-        if req_ids and not req_ids.issubset(ids):
-            continue
-        score = len(req_ids & ids)*2 + len(opt_ids & ids)
-        if score <= 0:
-            continue
+        score, hit_ids = scored[r['id']]
         r['score'] = score
-        r['hit_labels'] = [n for n in (r['hit_names'] or '').split(',') if n]
-        if r['id'] not in seen:
-            out.append(r); seen.add(r['id'])
+        r['hit_labels'] = [idx.name_of(i) for i in hit_ids]
+        out.append(r)
 
     out.sort(key=lambda x: (-x['score'], x.get('time_min') or 999, x['name']))
     id_hits = {h['id'] for h in hits}
     return hits + [o for o in out if o['id'] not in id_hits]
 
 
-def ensure_ing(name):
-    r = query('SELECT id FROM ingredients WHERE name=%s', (name,), one=True)
-    return r['id'] if r else execute('INSERT INTO ingredients (name) VALUES (%s)', (name,))
-
-
-def ensure_dish(d):
-    r = query('SELECT id FROM dishes WHERE name=%s', (d['name'],), one=True)
-    if r:
-        return r['id']
-    return execute('INSERT INTO dishes (name,cuisine,time_min,difficulty,veg,spice_level,image_url) VALUES (%s,%s,%s,%s,%s,%s,%s)',
-                   (d['name'], d['cuisine'], d['time_min'], d['difficulty'], d['veg'], d['spice_level'], d.get('image_url','/static/img/placeholder.jpg')))
+def match_dishes(raw):
+    idx = ingredient_index.ensure()
+    scored = _match_scores(idx, raw)
+    hits = dish_name_hits(raw)
+    if not scored:
+        return hits
+    ids = list(scored)
+    rows = query(DISH_COLS + ' WHERE id IN (' + ','.join(['%s']*len(ids)) + ')', ids)
+    return _rank_matches(idx, scored, rows, hits)
 
 
-def link_di(dish_id, ing_names):
-    for n in ing_names:
-        iid = ensure_ing(n)
-        execute('INSERT IGNORE INTO dish_ingredients (dish_id,ingredient_id) VALUES (%s,%s)', (dish_id, iid))
+async def amatch_dishes(raw):
+    await _aliases.aensure()
+    idx = await ingredient_index.aensure()
+    scored = _match_scores(idx, raw)
+    hits = await adish_name_hits(raw)
+    if not scored:
+        return hits
+    ids = list(scored)
+    rows = await adb.query(DISH_COLS + ' WHERE id IN (' + ','.join(['%s']*len(ids)) + ')', ids)
+    return _rank_matches(idx, scored, rows, hits)
 
 
-def pref_filter_sql(user_id=1):
-    p = get_prefs(user_id)
+def compile_pref_filter(p):
     w, params = [], []
 
     tm = p.get('time_max')
@@ -406,7 +566,9 @@ def pref_filter_sql(user_id=1):
     avoid_tokens = []
     for src in (p.get('allergies') or '', p.get('avoid') or ''):
         r, o, x = normalize_tokens(src)
-        avoid_tokens.extend([t for t in (r + o + x) if t])
+        for t in r + o + x:
+            if t and t not in avoid_tokens:
+                avoid_tokens.append(t)
 
     if avoid_tokens:
         placeholders = ','.join(['%s'] * len(avoid_tokens))
@@ -418,34 +580,17 @@ def pref_filter_sql(user_id=1):
         params.extend(avoid_tokens)
 
     sql = (' AND ' + ' AND '.join(w)) if w else ''
-    return sql, params
-
-
-def ingredient_terms_from_text(s):
-    s = (s or '').lower().strip()
-    if not s: return []
-    parts = re.split(r'[,\+\|\-\/]+', s)
-    aliases = {
-        'chkn':'chicken','chikn':'chicken','chk':'chicken','murghi':'chicken',
-        'qeema':'keema','keema':'keema',
-        'aloo':'potato','bhindi':'okra','saag':'spinach','machli':'fish',
-        'dal':'dal','daal':'dal','dāl':'dal',
-        'masoor':'masoor dal','moong':'moong dal','chanadal':'chana dal','chana':'chana dal',
-        'mash':'urad dal','urad':'urad dal',
-        'chawal':'rice','chāwal':'rice'
-    }
-    out=[]
-    for p in parts:
-        t=p.strip()
-        if not t: continue
-        if t.endswith('s') and len(t)>3: t=t[:-1]
-        t=aliases.get(t,t)
-        out.append(t)
-    seen=set(); flat=[]
-    for t in out:
-        if t and t not in seen:
-            flat.append(t); seen.add(t)
-    return flat
+    return sql, tuple(params)
+
+
+def pref_filter_sql(user_id=1):
+    key = _prefs_key(user_id)
+    compiled = _pref_filters.get(key)
+    if compiled is None:
+        compiled = compile_pref_filter(get_prefs(user_id))
+        _pref_filters.set(key, compiled)
+    sql, params = compiled
+    return sql, list(params)
 
 
 def week_start(d=None):
@@ -454,22 +599,26 @@ def week_start(d=None):
 
 
 def library_candidates(user_id=1, limit=6):
-    today = date.today()
-    cd = get_cooldown_days(user_id)
-    pf_sql, pf_params = pref_filter_sql(user_id)
-    sql = ('SELECT d.id,d.name,d.cuisine,d.time_min,d.difficulty,d.veg,d.spice_level,d.image_url '
-           'FROM user_library ul JOIN dishes d ON d.id=ul.dish_id '
-           'WHERE ul.user_id=%s AND ul.active=1 AND d.id NOT IN '
-           '(SELECT dish_id FROM day_plan WHERE user_id=%s AND date>=%s)') + pf_sql + ' ORDER BY RAND() LIMIT %s'
-    return query(sql, [user_id, user_id, today - timedelta(days=cd)] + pf_params + [limit])
-
-
-def pk_catalog_candidates(user_id=1, limit=6):
-    pf_sql, pf_params = pref_filter_sql(user_id)
-    sql = ('SELECT d.id,d.name,d.cuisine,d.time_min,d.difficulty,d.veg,d.spice_level,d.image_url '
-           'FROM dishes d LEFT JOIN user_library ul ON ul.dish_id=d.id AND ul.user_id=%s '
-           'WHERE d.cuisine=%s AND (ul.dish_id IS NULL OR ul.active=0)') + pf_sql + ' ORDER BY RAND() LIMIT %s'
-    return query(sql, [user_id, 'Pakistani'] + pf_params + [limit])
+    return library_rows(user_id, candidate_pool(user_id).fresh.sample(limit))
+
+
+def pk_catalog_candidates(user_id=1, limit=6, cuisine='Pakistani'):
+    pools = _catalog_pools.get(user_id)
+    if pools is None:
+        pools = {}
+        _catalog_pools.set(user_id, pools)
+    ids = pools.get(cuisine)
+    if ids is None:
+        pf_sql, pf_params = pref_filter_sql(user_id)
+        sql = ('SELECT d.id FROM dishes d LEFT JOIN user_library ul ON ul.dish_id=d.id AND ul.user_id=%s '
+               'WHERE d.cuisine=%s AND (ul.dish_id IS NULL OR ul.active=0)') + pf_sql
+        ids = pools[cuisine] = [r['id'] for r in query(sql, [user_id, cuisine] + pf_params)]
+    picked = rng.sample(ids, min(limit, len(ids)))
+    if not picked:
+        return []
+    rows = query('SELECT d.id,d.name,d.cuisine,d.time_min,d.difficulty,d.veg,d.spice_level,d.image_url FROM dishes d WHERE d.id IN (' + ','.join(['%s']*len(picked)) + ')', picked)
+    by_id = {r['id']: r for r in rows}
+    return [by_id[i] for i in picked if i in by_id]
 
 
 def ensure_weekly_discover(user_id=1, total=8, lib_target=4, web_target=4):
@@ -506,11 +655,16 @@ def previously_seen_names(user_id=1):
     return {r['n'] for r in rows}
 
 
-def web_weekly_candidates(user_id=1, limit=12):
-    lib_names = {(r['name'] or '').strip().lower() for r in query('SELECT d.name FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1', (user_id,))}
-    ws = week_start()
-    curr_names = {(r['name'] or '').strip().lower() for r in query('SELECT name FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s', (user_id, ws, 'web'))}
-    pool = web_area_list('Pakistani', 60) + web_area_list('Indian', 60)
+LIBRARY_NAMES_SQL = 'SELECT d.name FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1'
+WEB_FEED_NAMES_SQL = 'SELECT name FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s'
+DISCOVER_GENERATION_SQL = 'SELECT generated_at FROM discover_generation WHERE user_id=%s AND week_start=%s'
+
+
+def _names(rows):
+    return {(r['name'] or '').strip().lower() for r in rows}
+
+
+def _pick_weekly(pool, lib_names, curr_names, limit):
     out, seen = [], set()
     random.shuffle(pool)
     for m in pool:
@@ -524,48 +678,99 @@ def web_weekly_candidates(user_id=1, limit=12):
     return out
 
 
-def ensure_weekly_web_discover(user_id=1, total=12):
+def web_weekly_candidates(user_id=1, limit=12, exclude_current=True):
+    lib_names = _names(query(LIBRARY_NAMES_SQL, (user_id,)))
+    curr_names = _names(query(WEB_FEED_NAMES_SQL, (user_id, week_start(), 'web'))) if exclude_current else set()
+    return _pick_weekly(web_area_lists(['Pakistani', 'Indian'], 60), lib_names, curr_names, limit)
+
+
+async def aweb_weekly_candidates(user_id=1, limit=12, exclude_current=True):
+    lib_names = _names(await adb.query(LIBRARY_NAMES_SQL, (user_id,)))
+    curr_names = _names(await adb.query(WEB_FEED_NAMES_SQL, (user_id, week_start(), 'web'))) if exclude_current else set()
+    return _pick_weekly(await aweb_area_lists(['Pakistani', 'Indian'], 60), lib_names, curr_names, limit)
+
+
+def _generation_fresh(gen):
+    if not gen:
+        return False
+    max_age = config.DISCOVER_MAX_AGE_HOURS
+    return not max_age or datetime.now() - gen['generated_at'] < timedelta(hours=max_age)
+
+
+def discover_feed_fresh(user_id=1, ws=None):
+    return _generation_fresh(query(DISCOVER_GENERATION_SQL, (user_id, ws or week_start()), one=True))
+
+
+async def adiscover_feed_fresh(user_id=1, ws=None):
+    return _generation_fresh(await adb.query(DISCOVER_GENERATION_SQL, (user_id, ws or week_start()), one=True))
+
+
+WEB_FEED_DELETE_SQL = 'DELETE FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s'
+WEB_FEED_INSERT_SQL = 'INSERT INTO discover_feed (user_id,week_start,source,sort_rank,name,image_url,source_url,time_min,cuisine,difficulty,veg) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
+DISCOVER_GENERATION_UPSERT_SQL = 'INSERT INTO discover_generation (user_id,week_start,generated_at,items) VALUES (%s,%s,%s,%s) ON DUPLICATE KEY UPDATE generated_at=VALUES(generated_at), items=VALUES(items)'
+
+
+def _web_feed_rows(user_id, ws, items):
+    return [(user_id, ws, 'web', rnk, w.get('name'), w.get('image_url'), w.get('source_url',''), w.get('time_min'), w.get('cuisine'), w.get('difficulty'), int(w.get('veg',0)))
+            for rnk, w in enumerate(items, 1)]
+
+
+def ensure_weekly_web_discover(user_id=1, total=12, force=False):
     ws = week_start()
-    execute('DELETE FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s', (user_id, ws, 'web'))
-    items = web_weekly_candidates(user_id, total)
-    rnk = 1
-    for w in items:
-        execute(
-            'INSERT INTO discover_feed (user_id,week_start,source,sort_rank,name,image_url,source_url,time_min,cuisine,difficulty,veg) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)',
-            (user_id, ws, 'web', rnk, w.get('name'), w.get('image_url'), w.get('source_url',''), w.get('time_min'), w.get('cuisine'), w.get('difficulty'), int(w.get('veg',0)))
-        )
-        rnk += 1
+    if not force and discover_feed_fresh(user_id, ws):
+        return False
+    items = web_weekly_candidates(user_id, total, exclude_current=False)
+    if not items:
+        return False
+    rows = _web_feed_rows(user_id, ws, items)
+    with transaction():
+        execute(WEB_FEED_DELETE_SQL, (user_id, ws, 'web'))
+        execute_many(WEB_FEED_INSERT_SQL, rows)
+        execute(DISCOVER_GENERATION_UPSERT_SQL, (user_id, ws, datetime.now(), len(rows)))
+        respcache.bump(user_id)
+    return True
+
+
+async def aensure_weekly_web_discover(user_id=1, total=12, force=False):
+    ws = week_start()
+    if not force and await adiscover_feed_fresh(user_id, ws):
+        return False
+    items = await aweb_weekly_candidates(user_id, total, exclude_current=False)
+    if not items:
+        return False
+    rows = _web_feed_rows(user_id, ws, items)
+    async with adb.transaction():
+        await adb.execute(WEB_FEED_DELETE_SQL, (user_id, ws, 'web'))
+        await adb.execute_many(WEB_FEED_INSERT_SQL, rows)
+        await adb.execute(DISCOVER_GENERATION_UPSERT_SQL, (user_id, ws, datetime.now(), len(rows)))
+        await adb.execute(respcache.BUMP_SQL, (user_id,))
+    return True
+
+
+def _web_dish(payload):
+    return {
+        'name': payload.get('name'),
+        'cuisine': payload.get('cuisine') or 'Pakistani',
+        'time_min': int(payload.get('time_min') or 40),
+        'difficulty': payload.get('difficulty') or 'Medium',
+        'veg': int(payload.get('veg') or 0),
+        'spice_level': payload.get('spice_level') or 'Medium',
+        'image_url': payload.get('image_url') or None,
+        'ings': payload.get('ings'),
+    }
 
 
 def ensure_web_dish_into_library(payload, user_id=1):
-    name = (payload.get('name') or '').strip()
-    if not name:
-        return None
-    row = query('SELECT id FROM dishes WHERE name=%s', (name,), one=True)
-    if row:
-        did = row['id']
-        execute('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (user_id, did))
-        if payload.get('image_url'):
-            execute('UPDATE dishes SET image_url=CASE WHEN COALESCE(image_url,"")="" THEN %s ELSE image_url END WHERE id=%s', (payload.get('image_url'), did))
-        return did
-    time_min = int(payload.get('time_min') or 40)
-    cuisine = payload.get('cuisine') or 'Pakistani'
-    difficulty = payload.get('difficulty') or 'Medium'
-    veg = int(payload.get('veg') or 0)
-    spice = payload.get('spice_level') or 'Medium'
-    image_url = payload.get('image_url') or '/static/img/placeholder.jpg'
-    did = execute('INSERT INTO dishes (name,cuisine,time_min,difficulty,veg,spice_level,image_url) VALUES (%s,%s,%s,%s,%s,%s,%s)', (name,cuisine,time_min,difficulty,veg,spice,image_url))
-    execute('INSERT IGNORE INTO user_library (user_id,dish_id) VALUES (%s,%s)', (user_id, did))
-    return did
+    return upsert_dish(_web_dish(payload), user_id)
 
 
 def ensure_materialized_feed(user_id=1):
     ws = week_start()
     rows = query('SELECT id,name,image_url,source_url,time_min,cuisine,difficulty,veg FROM discover_feed WHERE user_id=%s AND week_start=%s AND source=%s AND (dish_id IS NULL OR dish_id=0)', (user_id, ws, 'web'))
-    for r in rows:
-        did = ensure_web_dish_into_library(r, user_id)
-        if did:
-            execute('UPDATE discover_feed SET dish_id=%s WHERE id=%s', (did, r['id']))
+    if not rows:
+        return
+    ids = upsert_dishes([_web_dish(r) for r in rows], user_id)['ids']
+    execute_many('UPDATE discover_feed SET dish_id=%s WHERE id=%s', [(ids[r['name'].strip()], r['id']) for r in rows if (r['name'] or '').strip() in ids])
 
 
 def discover_candidates(user_id=1, limit=3):
@@ -596,13 +801,7 @@ def days_ago(d):
     return (date.today() - d).days
 
 
-def web_area_list(area, limit=60):
-    try:
-        r = requests.get('https://www.themealdb.com/api/json/v1/1/filter.php', params={'a': area}, timeout=6)
-        j = r.json() if r.status_code == 200 else {}
-        meals = j.get('meals') or []
-    except Exception:
-        meals = []
+def _area_items(meals, area, limit):
     out = []
     for m in meals:
         out.append({
@@ -616,3 +815,25 @@ def web_area_list(area, limit=60):
         })
     random.shuffle(out)
     return out[:limit]
+
+
+def web_area_list(area, limit=60):
+    try:
+        meals = mealdb.filter_area(area)
+    except Exception:
+        meals = []
+    return _area_items(meals, area, limit)
+
+
+def web_area_lists(areas, limit=60):
+    out = []
+    for area, meals in zip(areas, mealdb.filter_areas(areas)):
+        out.extend(_area_items(meals, area, limit))
+    return out
+
+
+async def aweb_area_lists(areas, limit=60):
+    out = []
+    for area, meals in zip(areas, await mealdb.afilter_areas(areas)):
+        out.extend(_area_items(meals, area, limit))
+    return out
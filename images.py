@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import os
+import threading
+import time
+from PIL import Image
+import config
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
+PLACEHOLDER = '/static/img/placeholder.jpg'
+SIZES = (('hero', 1), ('card', 2), ('thumb', 4))
+
+
+def _center_crop_ratio(img, rw=16, rh=9):
+    w, h = img.size
+    tr = rw / rh
+    cr = w / h
+    if cr > tr:
+        nw = int(h * tr)
+        x = (w - nw) // 2
+        return img.crop((x, 0, x + nw, h))
+    nh = int(w / tr)
+    y = (h - nh) // 2
+    return img.crop((0, y, w, y + nh))
+
+
+def render_variants(data, w=1280, h=720, timings=None):
+    timings = {} if timings is None else timings
+    t = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        img.draft('RGB', (w, h))
+    img.load()
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    timings['decode'] = time.perf_counter() - t
+    t = time.perf_counter()
+    hero = _center_crop_ratio(img, 16, 9).resize((w, h), Image.LANCZOS, reducing_gap=3.0)
+    out = {name: hero if factor == 1 else hero.reduce(factor) for name, factor in SIZES}
+    timings['resize'] = time.perf_counter() - t
+    return out
+
+
+def check_image(data):
+    try:
+        Image.open(io.BytesIO(data)).verify()
+    except Exception as e:
+        raise ValueError('not a readable image') from e
+
+
+def encode_webp(img, quality=85):
+    buf = io.BytesIO()
+    img.save(buf, format='WEBP', quality=quality, method=config.IMAGE_WEBP_METHOD)
+    return buf.getvalue()
+
+
+def variant_url(url, size):
+    if url and url.endswith('-hero.webp') and size != 'hero':
+        return url[:-len('hero.webp')] + f'{size}.webp'
+    return url
+
+
+class ImagePipeline:
+    def __init__(self, directory, workers=2):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = {'submitted': 0, 'processed': 0, 'deduped': 0, 'failed': 0, 'queued': 0}
+        self.timings = {'decode': 0.0, 'resize': 0.0, 'encode': 0.0, 'write': 0.0}
+
+    def _name(self, digest, size):
+        return f'{digest}-{size}.webp'
+
+    def url(self, digest, size='hero'):
+        return f'/static/uploads/{self._name(digest, size)}'
+
+    def _exists(self, digest):
+        return os.path.exists(os.path.join(self.directory, self._name(digest, 'hero')))
+
+    def _work(self, digest, data):
+        timings = {}
+        try:
+            variants = render_variants(data, timings=timings)
+            t = time.perf_counter()
+            blobs = {size: encode_webp(img) for size, img in variants.items()}
+            timings['encode'] = time.perf_counter() - t
+            t = time.perf_counter()
+            for size in ('thumb', 'card', 'hero'):
+                path = os.path.join(self.directory, self._name(digest, size))
+                tmp = f'{path}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(blobs[size])
+                os.replace(tmp, path)
+            timings['write'] = time.perf_counter() - t
+            with self.lock:
+                self.stats['processed'] += 1
+                for k, v in timings.items():
+                    self.timings[k] += v
+            return self.url(digest)
+        except Exception:
+            with self.lock:
+                self.stats['failed'] += 1
+            raise
+        finally:
+            with self.lock:
+                self.stats['queued'] -= 1
+                self.inflight.pop(digest, None)
+
+    def submit(self, data):
+        check_image(data)
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        with self.lock:
+            self.stats['submitted'] += 1
+            if digest in self.inflight:
+                self.stats['deduped'] += 1
+                return self.url(digest), self.inflight[digest]
+            if self._exists(digest):
+                self.stats['deduped'] += 1
+                return self.url(digest), None
+            self.stats['queued'] += 1
+            fut = self.inflight[digest] = self.pool.submit(self._work, digest, data)
+        return self.url(digest), fut
+
+    def process(self, data):
+        url, fut = self.submit(data)
+        return fut.result() if fut else url
+
+    def snapshot(self):
+        with self.lock:
+            s = dict(self.stats)
+            done = s['processed'] or 1
+            s.update({f'{k}_avg': v / done for k, v in self.timings.items()})
+            s.update({f'{k}_total': v for k, v in self.timings.items()})
+        return s
+
+
+pipeline = ImagePipeline(UPLOAD_DIR, workers=config.IMAGE_WORKERS)
@@ -0,0 +1,177 @@
+import base64
+import hashlib
+import hmac
+import ipaddress
+import os
+import socket
+import threading
+from urllib.parse import urlsplit
+import requests
+import config
+import profiler
+from cache import SingleFlight
+from images import SIZES, render_variants, encode_webp
+
+
+class BadKey(ValueError):
+    pass
+
+
+def _b64(b):
+    return base64.urlsafe_b64encode(b).rstrip(b'=').decode()
+
+
+def _sig(url):
+    return hmac.new(config.SECRET_KEY.encode(), url.encode(), hashlib.sha256).hexdigest()[:20]
+
+
+def allowed(url):
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    return parts.scheme in ('http', 'https') and any(host == h or host.endswith('.' + h) for h in config.IMG_PROXY_HOSTS)
+
+
+def _public(host, port):
+    try:
+        infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except OSError:
+        return False
+    for info in infos:
+        ip = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            return False
+    return bool(infos)
+
+
+def sign(url):
+    return f'{_b64(url.encode())}.{_sig(url)}'
+
+
+def unsign(key):
+    data, _, sig = key.rpartition('.')
+    try:
+        url = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)).decode()
+    except ValueError:
+        raise BadKey(key)
+    if not allowed(url) or not hmac.compare_digest(sig, _sig(url)):
+        raise BadKey(key)
+    return url
+
+
+class ImageProxy:
+    def __init__(self, directory, budget, timeout=6, max_bytes=10 << 20):
+        self.directory = directory
+        self.budget = budget
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        self.flight = SingleFlight()
+        self.lock = threading.Lock()
+        self.used = None
+        self.stats = {'hits': 0, 'fetched': 0, 'evicted': 0, 'errors': 0}
+        for size, _ in SIZES:
+            os.makedirs(os.path.join(directory, size), exist_ok=True)
+
+    def path(self, digest, size):
+        return os.path.join(self.directory, size, f'{digest}.webp')
+
+    def _files(self):
+        for size, _ in SIZES:
+            d = os.path.join(self.directory, size)
+            for e in os.scandir(d):
+                if e.name.endswith('.webp'):
+                    yield e
+
+    def _download(self, url):
+        parts = urlsplit(url)
+        if not allowed(url) or not _public(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)):
+            raise ValueError(f'refusing to fetch {url}')
+        with self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as r:
+            r.raise_for_status()
+            if r.status_code != 200:
+                raise ValueError(f'unexpected status {r.status_code}: {url}')
+            buf = bytearray()
+            for chunk in r.iter_content(65536):
+                buf += chunk
+                if len(buf) > self.max_bytes:
+                    raise ValueError(f'image too large: {url}')
+        return bytes(buf)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _fill(self, digest, url):
+        cached = {name: self._read(self.path(digest, name)) for name, _ in SIZES}
+        if all(v is not None for v in cached.values()):
+            return cached
+        try:
+            with profiler.timed('http'):
+                data = self._download(url)
+            with profiler.timed('image'):
+                variants = render_variants(data)
+        except Exception:
+            with self.lock:
+                self.stats['errors'] += 1
+            raise
+        added = 0
+        blobs = {}
+        for name, img in variants.items():
+            with profiler.timed('image'):
+                blob = blobs[name] = encode_webp(img)
+            path = self.path(digest, name)
+            try:
+                added -= os.path.getsize(path)
+            except OSError:
+                pass
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, path)
+            added += len(blob)
+        with self.lock:
+            self.stats['fetched'] += 1
+            if self.used is not None:
+                self.used += added
+        self.evict()
+        return blobs
+
+    def get(self, url, size='card'):
+        digest = hashlib.sha256(url.encode()).hexdigest()[:32]
+        data = self._read(self.path(digest, size))
+        if data is not None:
+            with self.lock:
+                self.stats['hits'] += 1
+            return digest, data
+        return digest, self.flight.do(digest, lambda: self._fill(digest, url))[size]
+
+    def evict(self):
+        with self.lock:
+            if self.used is None:
+                self.used = sum(e.stat().st_size for e in self._files())
+            if self.used <= self.budget:
+                return
+            files = sorted(self._files(), key=lambda e: e.stat().st_mtime)
+            target = self.budget * 0.9
+            for e in files:
+                if self.used <= target:
+                    break
+                try:
+                    size = e.stat().st_size
+                    os.remove(e.path)
+                except OSError:
+                    continue
+                self.used -= size
+                self.stats['evicted'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, bytes=self.used, budget=self.budget)
+
+
+proxy = ImageProxy(config.IMG_PROXY_DIR, config.IMG_PROXY_BUDGET, timeout=config.MEALDB_TIMEOUT)
@@ -0,0 +1,114 @@
+from difflib import get_close_matches
+import threading
+import time
+import config
+from db import query
+import adb
+
+INGREDIENTS_SQL = 'SELECT id,name FROM ingredients'
+LINKS_SQL = 'SELECT dish_id,ingredient_id FROM dish_ingredients'
+
+
+def _grams(s):
+    s = f'  {s} '
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class IngredientIndex:
+    def __init__(self, ttl=300, fuzzy_candidates=50):
+        self.ttl = ttl
+        self.fuzzy_candidates = fuzzy_candidates
+        self.lock = threading.RLock()
+        self.loaded_at = 0
+        self.ids = {}
+        self.names = {}
+        self.grams = {}
+        self.postings = {}
+        self.dish_ings = {}
+
+    def stale(self):
+        return not self.loaded_at or (self.ttl and time.monotonic() - self.loaded_at > self.ttl)
+
+    def ensure(self):
+        if self.stale():
+            self.load()
+        return self
+
+    async def aensure(self):
+        if self.stale():
+            self.fill(await adb.query(INGREDIENTS_SQL), await adb.query(LINKS_SQL))
+        return self
+
+    def load(self):
+        self.fill(query(INGREDIENTS_SQL), query(LINKS_SQL))
+
+    def fill(self, ings, links):
+        ids, names, grams, postings, dish_ings = {}, {}, {}, {}, {}
+        for r in ings:
+            ids[r['name']] = r['id']
+            names[r['id']] = r['name']
+            for gm in _grams(r['name']):
+                grams.setdefault(gm, set()).add(r['name'])
+        for r in links:
+            postings.setdefault(r['ingredient_id'], set()).add(r['dish_id'])
+            dish_ings.setdefault(r['dish_id'], set()).add(r['ingredient_id'])
+        with self.lock:
+            self.ids, self.names, self.grams, self.postings, self.dish_ings = ids, names, grams, postings, dish_ings
+            self.loaded_at = time.monotonic()
+
+    def add_ingredient(self, iid, name):
+        with self.lock:
+            if not self.loaded_at or name in self.ids:
+                return
+            self.ids[name] = iid
+            self.names[iid] = name
+            for gm in _grams(name):
+                self.grams.setdefault(gm, set()).add(name)
+
+    def link(self, dish_id, ing_ids):
+        with self.lock:
+            if not self.loaded_at:
+                return
+            for iid in ing_ids:
+                self.postings.setdefault(iid, set()).add(dish_id)
+                self.dish_ings.setdefault(dish_id, set()).add(iid)
+
+    def fuzzy(self, token):
+        counts = {}
+        for gm in _grams(token):
+            for name in self.grams.get(gm, ()):
+                counts[name] = counts.get(name, 0) + 1
+        cands = sorted(counts, key=counts.get, reverse=True)[:self.fuzzy_candidates]
+        best = get_close_matches(token, cands, n=1, cutoff=0.8)
+        return best[0] if best else None
+
+    def resolve(self, tokens):
+        resolved = {}
+        with self.lock:
+            for t in tokens:
+                name = t if t in self.ids else self.fuzzy(t)
+                if name:
+                    resolved[t] = self.ids[name]
+        return resolved
+
+    def dishes_with_all(self, ing_ids):
+        with self.lock:
+            sets = sorted((self.postings.get(i, set()) for i in ing_ids), key=len)
+            return set.intersection(*sets) if sets else set()
+
+    def dishes_with_any(self, ing_ids):
+        with self.lock:
+            out = set()
+            for i in ing_ids:
+                out |= self.postings.get(i, set())
+            return out
+
+    def ingredients_of(self, dish_id):
+        with self.lock:
+            return self.dish_ings.get(dish_id, set())
+
+    def name_of(self, iid):
+        return self.names.get(iid)
+
+
+index = IngredientIndex(ttl=config.INGREDIENT_INDEX_TTL)
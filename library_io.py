@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import time
+import zlib
+from datetime import date, datetime
+import config
+from db import transaction
+from catalog import upsert_dishes
+from normalize import ingredient_terms_from_text
+
+TRUTHY = ['1','true','True','yes','Yes']
+DIFFICULTIES = ['Easy','Medium','Hard']
+SPICE_LEVELS = ['Low','Medium','High','Spicy']
+MAX_LEN = {'name': 255, 'cuisine': 80, 'ingredient': 120}
+MAX_TIME_MIN = 2 ** 31 - 1
+ECHO_LEN = 40
+REPORT_ERROR_CHARS = 1500
+
+
+def _echo(v):
+    return repr(v[:ECHO_LEN] + '…' if len(v) > ECHO_LEN else v)
+
+
+def _text_field(row, key, limit):
+    v = (row.get(key) or '').strip()
+    if len(v) > limit:
+        raise ValueError(f'{key} longer than {limit} characters')
+    return v
+
+
+def _choice(row, key, choices, default):
+    v = (row.get(key) or '').strip()
+    if not v:
+        return default
+    for c in choices:
+        if c.lower() == v.lower():
+            return c
+    raise ValueError(f'bad {key} {_echo(v)} (expected one of {", ".join(choices)})')
+
+
+def _parse_row(row):
+    name = _text_field(row, 'name', MAX_LEN['name'])
+    if not name:
+        return None
+    tm = (row.get('time_min') or '').strip()
+    try:
+        time_min = int(float(tm)) if tm else 30
+    except (ValueError, OverflowError):
+        raise ValueError(f'bad time_min {_echo(tm)}')
+    if not 0 <= time_min <= MAX_TIME_MIN:
+        raise ValueError(f'bad time_min {_echo(tm)}')
+    ings = ingredient_terms_from_text((row.get('ingredients') or '').replace(';', ','))
+    long_ing = next((i for i in ings if len(i) > MAX_LEN['ingredient']), None)
+    if long_ing:
+        raise ValueError(f'ingredient longer than {MAX_LEN["ingredient"]} characters: {_echo(long_ing)}')
+    return {
+        'name': name,
+        'cuisine': _text_field(row, 'cuisine', MAX_LEN['cuisine']),
+        'time_min': time_min,
+        'difficulty': _choice(row, 'difficulty', DIFFICULTIES, 'Easy'),
+        'veg': 1 if str(row.get('veg') or '0').strip() in TRUTHY else 0,
+        'spice_level': _choice(row, 'spice_level', SPICE_LEVELS, 'Medium'),
+        'ings': ings,
+    }
+
+
+def _flush(chunk, user_id):
+    return upsert_dishes(chunk, user_id, reactivate=True, owner=user_id)['created']
+
+
+def import_csv(stream, user_id=1, batch=None):
+    batch = batch or config.IMPORT_BATCH
+    start = time.perf_counter()
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', errors='ignore', newline=''))
+    report = {'rows': 0, 'imported': 0, 'created': 0, 'skipped': 0, 'error_count': 0, 'errors': []}
+    error_chars = 0
+    chunk = []
+    with transaction():
+        for row in reader:
+            report['rows'] += 1
+            try:
+                d = _parse_row(row)
+            except ValueError as e:
+                report['error_count'] += 1
+                error_chars += len(str(e))
+                if len(report['errors']) < config.IMPORT_MAX_ERRORS and error_chars <= REPORT_ERROR_CHARS:
+                    report['errors'].append({'line': reader.line_num, 'error': str(e)})
+                continue
+            if d is None:
+                report['skipped'] += 1
+                continue
+            chunk.append(d)
+            if len(chunk) >= batch:
+                report['created'] += _flush(chunk, user_id)
+                report['imported'] += len(chunk)
+                chunk = []
+        if chunk:
+            report['created'] += _flush(chunk, user_id)
+            report['imported'] += len(chunk)
+    took = time.perf_counter() - start
+    report['seconds'] = round(took, 3)
+    report['rows_per_sec'] = round(report['rows'] / took) if took else report['rows']
+    return report
+
+
+def _text(v):
+    return v.isoformat() if isinstance(v, (date, datetime)) else v
+
+
+def csv_lines(rows, columns, flush_every=200):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(columns)
+    for i, r in enumerate(rows, 1):
+        w.writerow(['' if r.get(c) is None else _text(r[c]) for c in columns])
+        if i % flush_every == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def ndjson_lines(rows, columns, flush_every=200):
+    out = []
+    for r in rows:
+        out.append(json.dumps({c: _text(r.get(c)) for c in columns}) + '\n')
+        if len(out) >= flush_every:
+            yield ''.join(out)
+            out = []
+    if out:
+        yield ''.join(out)
+
+
+def gzip_chunks(chunks, level=6):
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for c in chunks:
+        data = z.compress(c.encode('utf-8'))
+        if data:
+            yield data
+    yield z.flush()
+
+
+def export_stream(rows, columns, fmt='csv', gz=False):
+    chunks = ndjson_lines(rows, columns) if fmt == 'ndjson' else csv_lines(rows, columns)
+    if gz:
+        return gzip_chunks(chunks)
+    return (c.encode('utf-8') for c in chunks)
@@ -0,0 +1,131 @@
+from datetime import date
+import json
+from db import query, execute, transaction
+
+BUCKETS = (15, 30, 45, 60, 90)
+
+
+def _bucket(t):
+    if t is None:
+        return None
+    for b in BUCKETS:
+        if t <= b:
+            return str(b)
+    return f'{BUCKETS[-1]}+'
+
+
+def _empty():
+    return {'total': 0, 'cuisines': {}, 'time': {}, 'time_sum': 0, 'time_n': 0, 'veg': 0, 'cooks': 0, 'cooks_by_month': {}, 'cooks_through': None}
+
+
+def _add_dish(s, r, sign=1):
+    s['total'] += sign
+    c = (r.get('cuisine') or '').strip()
+    if c:
+        s['cuisines'][c] = s['cuisines'].get(c, 0) + sign
+        if s['cuisines'][c] <= 0:
+            del s['cuisines'][c]
+    b = _bucket(r.get('time_min'))
+    if b:
+        s['time'][b] = s['time'].get(b, 0) + sign
+        if s['time'][b] <= 0:
+            del s['time'][b]
+        s['time_sum'] += sign * r['time_min']
+        s['time_n'] += sign
+    s['veg'] += sign * int(r.get('veg') or 0)
+
+
+def _add_cooks(s, rows):
+    for r in rows:
+        s['cooks_by_month'][r['m']] = s['cooks_by_month'].get(r['m'], 0) + r['n']
+        s['cooks'] += r['n']
+
+
+def compute(user_id):
+    s = _empty()
+    for r in query('SELECT d.cuisine, d.time_min, d.veg FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1', (user_id,)):
+        _add_dish(s, r)
+    today = date.today()
+    _add_cooks(s, query("SELECT DATE_FORMAT(date,'%%Y-%%m') m, COUNT(*) n FROM day_plan WHERE user_id=%s AND date<=%s GROUP BY m", (user_id, today)))
+    s['cooks_through'] = today.isoformat()
+    return s
+
+
+def _save(user_id, s):
+    execute('INSERT INTO library_stats (user_id,summary) VALUES (%s,%s) ON DUPLICATE KEY UPDATE summary=VALUES(summary)', (user_id, json.dumps(s)))
+
+
+def rebuild(user_id):
+    s = compute(user_id)
+    _save(user_id, s)
+    return s
+
+
+def _update(user_id, fn):
+    with transaction():
+        row = query('SELECT summary FROM library_stats WHERE user_id=%s FOR UPDATE', (user_id,), one=True)
+        s = json.loads(row['summary']) if row else None
+        if not s or not s.get('cooks_through'):
+            return rebuild(user_id)
+        fn(s)
+        _save(user_id, s)
+        return s
+
+
+def dishes_added(user_id, dish_ids, sign=1):
+    dish_ids = list(dish_ids)
+    if not dish_ids:
+        return
+    marks = ','.join(['%s'] * len(dish_ids))
+    rows = query(f'SELECT cuisine, time_min, veg FROM dishes WHERE id IN ({marks})', tuple(dish_ids))
+
+    def apply(s):
+        for r in rows:
+            _add_dish(s, r, sign)
+    _update(user_id, apply)
+
+
+def plans_added(user_id, dates):
+    through = date.today().isoformat()
+    dates = [d for d in dates if d.isoformat() <= through]
+    if not dates:
+        return
+
+    def apply(s):
+        for d in dates:
+            if d.isoformat() > s['cooks_through']:
+                continue
+            m = d.strftime('%Y-%m')
+            s['cooks_by_month'][m] = s['cooks_by_month'].get(m, 0) + 1
+            s['cooks'] += 1
+    _update(user_id, apply)
+
+
+def plan_added(user_id, d):
+    plans_added(user_id, [d])
+
+
+def _catch_up(user_id, s):
+    today = date.today()
+    _add_cooks(s, query("SELECT DATE_FORMAT(date,'%%Y-%%m') m, COUNT(*) n FROM day_plan WHERE user_id=%s AND date>%s AND date<=%s GROUP BY m",
+                        (user_id, date.fromisoformat(s['cooks_through']), today)))
+    s['cooks_through'] = today.isoformat()
+
+
+def get(user_id):
+    row = query('SELECT summary FROM library_stats WHERE user_id=%s', (user_id,), one=True)
+    s = json.loads(row['summary']) if row else None
+    if s is None or not s.get('cooks_through'):
+        return rebuild(user_id)
+    if s['cooks_through'] < date.today().isoformat():
+        s = _update(user_id, lambda s: _catch_up(user_id, s))
+    return s
+
+
+def summary(s):
+    return {
+        'total': s['total'],
+        'cuisines': len(s['cuisines']),
+        'avg_time': round(s['time_sum'] / s['time_n']) if s['time_n'] else 0,
+        'veg_pct': round(100 * s['veg'] / s['total']) if s['total'] else 0,
+    }
@@ -0,0 +1,229 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import config
+import profiler
+from cache import SingleFlight, AsyncSingleFlight
+
+
+class HttpBackend:
+    def __init__(self, base_url, timeout=6):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.MEALDB_WORKERS * 2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, path, params, headers):
+        with profiler.timed('http'):
+            r = self.session.get(f'{self.base_url}/{path}', params=params, headers=headers, timeout=self.timeout)
+        return r.status_code, r.headers, r.content
+
+
+class AsyncHttpBackend:
+    def __init__(self, base_url, timeout=6):
+        import httpx
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=config.ASYNC_HTTP_CONNECTIONS))
+
+    async def get(self, path, params, headers):
+        with profiler.timed('http'):
+            r = await self.client.get(f'{self.base_url}/{path}', params=params, headers=headers)
+        return r.status_code, r.headers, r.content
+
+
+class DiskCache:
+    def __init__(self, directory, budget=64 << 20):
+        self.directory = directory
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.used = None
+        self.evicted = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _files(self):
+        return (e for e in os.scandir(self.directory) if e.name.endswith('.json'))
+
+    def load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def store(self, key, entry):
+        path = self._path(key)
+        data = json.dumps(entry).encode()
+        try:
+            added = len(data) - os.path.getsize(path)
+        except OSError:
+            added = len(data)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            if self.used is not None:
+                self.used += added
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            if self.used is None:
+                self.used = sum(e.stat().st_size for e in self._files())
+            if self.used <= self.budget:
+                return
+            files = sorted(self._files(), key=lambda e: e.stat().st_mtime)
+            target = self.budget * 0.9
+            for e in files:
+                if self.used <= target:
+                    break
+                try:
+                    size = e.stat().st_size
+                    os.remove(e.path)
+                except OSError:
+                    continue
+                self.used -= size
+                self.evicted += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'bytes': self.used, 'budget': self.budget, 'evicted': self.evicted}
+
+
+class MealDBClient:
+    def __init__(self, backend, cache_dir, ttl=86400, budget=64 << 20):
+        self.backend = backend
+        self.cache = DiskCache(cache_dir, budget)
+        self.ttl = ttl
+        self.flight = SingleFlight()
+        self.aflight = AsyncSingleFlight()
+        self.abackend = None
+        self.pool = ThreadPoolExecutor(max_workers=config.MEALDB_WORKERS, thread_name_prefix='mealdb')
+        self.stats = {'fresh': 0, 'revalidated': 0, 'fetched': 0, 'stale': 0, 'errors': 0}
+
+    def _key(self, path, params):
+        return hashlib.sha1(json.dumps([path, sorted(params.items())]).encode()).hexdigest()
+
+    def get_json(self, path, params):
+        key = self._key(path, params)
+        return self.flight.do(key, lambda: self._fetch(key, path, params))
+
+    async def aget_json(self, path, params):
+        key = self._key(path, params)
+        return await self.aflight.do(key, lambda: self._afetch(key, path, params))
+
+    def _lookup(self, key):
+        entry = self.cache.load(key)
+        headers = {}
+        if entry and time.time() - entry['fetched_at'] < self.ttl:
+            self.stats['fresh'] += 1
+            return entry, None
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return entry, headers
+
+    def _failed(self, entry):
+        self.stats['errors'] += 1
+        if entry:
+            self.stats['stale'] += 1
+            return entry['body']
+        return None
+
+    def _fetch(self, key, path, params):
+        entry, headers = self._lookup(key)
+        if headers is None:
+            return entry['body']
+        try:
+            resp = self.backend.get(path, params, headers)
+        except Exception:
+            if not entry:
+                self.stats['errors'] += 1
+                raise
+            return self._failed(entry)
+        return self._settle(key, entry, *resp)
+
+    async def _afetch(self, key, path, params):
+        entry, headers = self._lookup(key)
+        if headers is None:
+            return entry['body']
+        if self.abackend is None:
+            self.abackend = AsyncHttpBackend(self.backend.base_url, self.backend.timeout)
+        try:
+            resp = await self.abackend.get(path, params, headers)
+        except Exception:
+            if not entry:
+                self.stats['errors'] += 1
+                raise
+            return self._failed(entry)
+        return self._settle(key, entry, *resp)
+
+    def _settle(self, key, entry, status, resp_headers, content):
+        now = time.time()
+        if status == 304 and entry:
+            self.stats['revalidated'] += 1
+            entry['fetched_at'] = now
+            self.cache.store(key, entry)
+            return entry['body']
+        if status != 200:
+            body = self._failed(entry)
+            return {} if body is None else body
+        body = json.loads(content) or {}
+        etag = resp_headers.get('ETag') or '"%s"' % hashlib.sha1(content).hexdigest()
+        if entry and entry.get('etag') == etag:
+            self.stats['revalidated'] += 1
+        else:
+            self.stats['fetched'] += 1
+        self.cache.store(key, {'fetched_at': now, 'etag': etag, 'last_modified': resp_headers.get('Last-Modified'), 'body': body})
+        return body
+
+    def search(self, q):
+        return self.get_json('search.php', {'s': q}).get('meals') or []
+
+    async def asearch(self, q):
+        return (await self.aget_json('search.php', {'s': q})).get('meals') or []
+
+    def filter_area(self, area):
+        return self.get_json('filter.php', {'a': area}).get('meals') or []
+
+    async def afilter_area(self, area):
+        return (await self.aget_json('filter.php', {'a': area})).get('meals') or []
+
+    def filter_areas(self, areas):
+        futures = [self.pool.submit(contextvars.copy_context().run, self.filter_area, a) for a in areas]
+        out = []
+        for f in futures:
+            try:
+                out.append(f.result())
+            except Exception:
+                out.append([])
+        return out
+
+    async def afilter_areas(self, areas):
+        res = await asyncio.gather(*(self.afilter_area(a) for a in areas), return_exceptions=True)
+        return [[] if isinstance(r, BaseException) else r for r in res]
+
+
+client = MealDBClient(HttpBackend(config.MEALDB_BASE_URL, config.MEALDB_TIMEOUT), config.MEALDB_CACHE_DIR, config.MEALDB_CACHE_TTL, config.MEALDB_CACHE_BUDGET)
+
+
+def set_backend(backend, abackend=None):
+    client.backend = backend
+    client.abackend = abackend
@@ -0,0 +1,171 @@
+from functools import lru_cache
+import re
+import threading
+import time
+import unicodedata
+from flask import has_app_context
+import config
+
+DEFAULT_ALIASES = {
+    'chkn': 'chicken', 'chikn': 'chicken', 'chk': 'chicken', 'murghi': 'chicken',
+    'qeema': 'keema',
+    'aloo': 'potato', 'bhindi': 'okra', 'saag': 'spinach', 'machli': 'fish',
+    'daal': 'dal',
+    'masoor': 'masoor dal', 'moong': 'moong dal', 'chanadal': 'chana dal', 'chana': 'chana dal',
+    'mash': 'urad dal', 'urad': 'urad dal',
+    'chawal': 'rice',
+}
+IRREGULAR = {
+    'leaves': 'leaf', 'halves': 'half', 'loaves': 'loaf', 'knives': 'knife',
+    'chilies': 'chili', 'chillies': 'chilli', 'cookies': 'cookie', 'brownies': 'brownie', 'smoothies': 'smoothie',
+}
+KEEP_S = {'hummus', 'couscous', 'asparagus', 'molasses', 'swiss', 'harissa', 'haggis', 'grass', 'bass'}
+
+_AND = re.compile(r'\band\b')
+_OR = re.compile(r'\bor\b')
+_OPS = re.compile(r'\s*([+|\-])\s*')
+_WS = re.compile(r'\s+')
+_TERM_SPLIT = re.compile(r'[,+|\-/]+')
+_PLURAL = (
+    (re.compile(r'([^aeiou])ies$'), r'\1y'),
+    (re.compile(r'(o|ch|sh|ss|x|z)es$'), r'\1'),
+    (re.compile(r'([^su])s$'), r'\1'),
+)
+
+
+def fold(s):
+    if s.isascii():
+        return s.lower()
+    s = unicodedata.normalize('NFKD', s)
+    return ''.join(c for c in s if not unicodedata.combining(c)).lower()
+
+
+def singular(t):
+    head, _, t = t.rpartition(' ')
+    if head:
+        return f'{head} {singular(t)}'
+    if t in IRREGULAR:
+        return IRREGULAR[t]
+    if len(t) <= 3 or t in KEEP_S:
+        return t
+    for rx, rep in _PLURAL:
+        out, n = rx.subn(rep, t)
+        if n:
+            return out
+    return t
+
+
+ALIASES_SQL = 'SELECT alias, canonical FROM ingredient_aliases'
+
+
+class AliasTable:
+    def __init__(self, defaults, ttl=300):
+        self.defaults = {fold(k): v for k, v in defaults.items()}
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.map = dict(self.defaults)
+        self.loaded_at = 0
+
+    def stale(self):
+        return not self.loaded_at or (self.ttl and time.monotonic() - self.loaded_at >= self.ttl)
+
+    def ensure(self):
+        if not has_app_context() or not self.stale():
+            return self
+        from db import query
+        try:
+            rows = query(ALIASES_SQL)
+        except Exception:
+            rows = []
+        return self.fill(rows)
+
+    async def aensure(self):
+        if not self.stale():
+            return self
+        import adb
+        try:
+            rows = await adb.query(ALIASES_SQL)
+        except Exception:
+            rows = []
+        return self.fill(rows)
+
+    def fill(self, rows):
+        merged = dict(self.defaults)
+        merged.update({singular(fold(r['alias']).strip()): fold(r['canonical']).strip() for r in rows})
+        with self.lock:
+            changed = merged != self.map
+            self.map = merged
+            self.loaded_at = time.monotonic()
+        if changed:
+            clear_caches()
+        return self
+
+    def invalidate(self):
+        self.loaded_at = 0
+
+    def get(self, t):
+        return self.map.get(t, t)
+
+
+aliases = AliasTable(DEFAULT_ALIASES, ttl=config.INGREDIENT_INDEX_TTL)
+
+
+@lru_cache(maxsize=8192)
+def term(t):
+    return aliases.get(singular(fold(t).strip()))
+
+
+@lru_cache(maxsize=4096)
+def _parse_query(s):
+    s = fold(s).strip().replace(',', ' ').replace('/', ' | ')
+    s = _OR.sub('|', _AND.sub('+', s))
+    s = _OPS.sub(r' \1 ', s)
+    op = '+'
+    required, optional, excluded = [], [], []
+    for p in _WS.split(s):
+        if not p:
+            continue
+        if p in ('+', '|', '-'):
+            op = p
+            continue
+        p = term(p)
+        (excluded if op == '-' else optional if op == '|' else required).append(p)
+    return tuple(required), tuple(optional), tuple(excluded)
+
+
+@lru_cache(maxsize=4096)
+def _terms(s):
+    out = []
+    for p in _TERM_SPLIT.split(fold(s)):
+        p = _WS.sub(' ', p).strip()
+        if p:
+            t = term(p)
+            if t not in out:
+                out.append(t)
+    return tuple(out)
+
+
+def normalize_tokens(s):
+    aliases.ensure()
+    return _parse_query(s or '')
+
+
+def ingredient_terms_from_text(s):
+    aliases.ensure()
+    return _terms(s or '')
+
+
+def clear_caches():
+    term.cache_clear()
+    _parse_query.cache_clear()
+    _terms.cache_clear()
+
+
+def set_alias(alias, canonical):
+    from db import execute
+    execute('INSERT INTO ingredient_aliases (alias,canonical) VALUES (%s,%s) ON DUPLICATE KEY UPDATE canonical=VALUES(canonical)', (alias.strip().lower(), canonical.strip().lower()))
+    aliases.invalidate()
+
+
+def cache_info():
+    return {'term': term.cache_info()._asdict(), 'query': _parse_query.cache_info()._asdict(), 'terms': _terms.cache_info()._asdict()}
@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+import config
+from db import query, execute_many, transaction
+from sampler import rng
+import library_stats
+from helpers import get_cooldown_days, pref_filter_sql, library_rows, invalidate_user, _adjust_history_counts
+
+
+def _time_bucket(t):
+    return 0 if not t else 1 if t <= 30 else 2 if t <= 60 else 3
+
+
+class _Dish:
+    __slots__ = ('id', 'cuisine', 'bucket', 'rating', 'last')
+
+    def __init__(self, r):
+        self.id = r['id']
+        self.cuisine = (r['cuisine'] or '').strip().lower()
+        self.bucket = _time_bucket(r['time_min'])
+        self.rating = r['rating'] or 3
+        self.last = r['last_cooked_at']
+
+
+def load(user_id, start, days, cooldown):
+    pf_sql, pf_params = pref_filter_sql(user_id)
+    dishes = [_Dish(r) for r in query('SELECT d.id, d.cuisine, d.time_min, ul.rating, ul.last_cooked_at FROM user_library ul JOIN dishes d ON d.id=ul.dish_id WHERE ul.user_id=%s AND ul.active=1' + pf_sql, [user_id] + pf_params)]
+    plans = query('SELECT date, dish_id FROM day_plan WHERE user_id=%s AND date BETWEEN %s AND %s', (user_id, start - timedelta(days=cooldown), start + timedelta(days=days - 1)))
+    return dishes, {p['date']: p['dish_id'] for p in plans}
+
+
+def solve(dishes, existing, start, days, cooldown, rand=None):
+    r = rand or rng
+    by_id = {d.id: d for d in dishes}
+    last = {d.id: d.last for d in dishes}
+    upcoming = {}
+    for day, did in sorted(existing.items()):
+        if day < start and did in last and (last[did] is None or day > last[did]):
+            last[did] = day
+        elif day >= start:
+            upcoming.setdefault(did, []).append(day)
+    cuisine_count = {}
+    out = {}
+    prev = None
+    for i in range(days):
+        day = start + timedelta(days=i)
+        if day in existing:
+            prev = by_id.get(existing[day])
+            if prev:
+                last[prev.id] = day
+                cuisine_count[prev.cuisine] = cuisine_count.get(prev.cuisine, 0) + 1
+            continue
+        best, best_score, fallback, fallback_gap = None, -1.0, None, -1
+        for d in dishes:
+            lc = last[d.id]
+            gap = config.SAMPLER_NEVER_COOKED_DAYS if lc is None else (day - lc).days
+            ahead = next((x for x in upcoming.get(d.id, ()) if x > day), None)
+            near = gap if ahead is None else min(gap, (ahead - day).days)
+            if near <= cooldown:
+                if near > fallback_gap and (lc is None or lc < day):
+                    fallback, fallback_gap = d, near
+                continue
+            score = min(gap, config.SAMPLER_NEVER_COOKED_DAYS) * d.rating / 3.0
+            score /= 1 + cuisine_count.get(d.cuisine, 0)
+            if prev is not None:
+                if d.cuisine and d.cuisine == prev.cuisine:
+                    score *= 0.5
+                if d.bucket == prev.bucket == 3:
+                    score *= 0.7
+            score *= 0.75 + 0.5 * r.random()
+            if score > best_score:
+                best, best_score = d, score
+        pick = best or fallback
+        if pick is None:
+            continue
+        out[day] = pick.id
+        last[pick.id] = day
+        cuisine_count[pick.cuisine] = cuisine_count.get(pick.cuisine, 0) + 1
+        prev = pick
+    return out
+
+
+def plan_range(user_id, start=None, days=7, write=True):
+    start = start or date.today()
+    days = max(1, min(int(days), config.PLAN_MAX_DAYS))
+    cooldown = get_cooldown_days(user_id)
+    dishes, existing = load(user_id, start, days, cooldown)
+    new = solve(dishes, existing, start, days, cooldown)
+    if write and new:
+        with transaction():
+            execute_many('INSERT IGNORE INTO day_plan (user_id,date,dish_id,is_override) VALUES (%s,%s,%s,0)', [(user_id, d, did) for d, did in sorted(new.items())])
+            existing = {p['date']: p['dish_id'] for p in query('SELECT date, dish_id FROM day_plan WHERE user_id=%s AND date BETWEEN %s AND %s', (user_id, start, start + timedelta(days=days - 1)))}
+        new = {d: did for d, did in new.items() if existing.get(d) == did}
+        library_stats.plans_added(user_id, list(new))
+        for d in new:
+            if d <= date.today():
+                _adjust_history_counts(user_id, d, True, 0)
+        invalidate_user(user_id)
+    else:
+        existing = {**existing, **new}
+    span = [start + timedelta(days=i) for i in range(days)]
+    rows = {r['id']: r for r in library_rows(user_id, list({existing[d] for d in span if d in existing}))}
+    return [{'date': d, 'dish': rows.get(existing.get(d)), 'new': d in new} for d in span]
@@ -0,0 +1,161 @@
+from collections import deque
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from flask import g, has_app_context, has_request_context, request
+import config
+
+log = logging.getLogger('mealmind.slow')
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+KINDS = ('db', 'http', 'image')
+EXPLAINABLE = ('select', 'update', 'delete', 'insert', 'replace')
+
+_lock = threading.Lock()
+routes = {}
+slow = deque(maxlen=50)
+totals = {'slow_queries': 0}
+
+
+def _current():
+    return g.get('_prof') if has_app_context() else None
+
+
+def add(kind, took, calls=1, rows=0):
+    p = _current()
+    if p is None:
+        return
+    with _lock:
+        p[kind] += took
+        p[f'{kind}_calls'] += calls
+        p['rows'] += rows
+
+
+@contextmanager
+def timed(kind):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(kind, time.perf_counter() - start)
+
+
+def _shape(params):
+    if params is None:
+        return 'none'
+    if isinstance(params, dict):
+        return 'dict(' + ','.join(sorted(params)) + ')'
+    if isinstance(params, (list, tuple)):
+        kinds = []
+        for v in params:
+            k = type(v).__name__ + (f'[{len(v)}]' if isinstance(v, (list, tuple)) else '')
+            if kinds and kinds[-1][0] == k:
+                kinds[-1][1] += 1
+            else:
+                kinds.append([k, 1])
+        return f'{len(params)}: ' + ','.join(k if n == 1 else f'{k}x{n}' for k, n in kinds)
+    return type(params).__name__
+
+
+def _explain(conn, sql, params):
+    if conn is None or not config.SLOW_QUERY_EXPLAIN or not sql.lstrip().lower().startswith(EXPLAINABLE):
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute('EXPLAIN ' + sql, params or ())
+            return cur.fetchall()
+    except Exception as e:
+        return f'explain failed: {e}'
+
+
+def db_call(conn, sql, params, took, rows=0, many=False):
+    add('db', took, rows=rows)
+    if not config.SLOW_QUERY_MS or took * 1000 < config.SLOW_QUERY_MS:
+        return
+    entry = {
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'ms': round(took * 1000, 2),
+        'route': request.endpoint if has_request_context() else None,
+        'sql': ' '.join(sql.split()),
+        'params': f'many x{len(params)}' if many else _shape(params),
+        'explain': None if many else _explain(conn, sql, params),
+    }
+    with _lock:
+        totals['slow_queries'] += 1
+        slow.append(entry)
+    log.warning('slow query %.1fms [%s] %s params=%s explain=%s', entry['ms'], entry['route'], entry['sql'], entry['params'], entry['explain'])
+
+
+def start():
+    g._prof = {'start': time.perf_counter(), 'rows': 0, **{k: 0.0 for k in KINDS}, **{f'{k}_calls': 0 for k in KINDS}}
+
+
+def finish(response):
+    p = g.pop('_prof', None)
+    if p is None:
+        return response
+    total = time.perf_counter() - p['start']
+    route = request.endpoint or 'unknown'
+    with _lock:
+        r = routes.get(route)
+        if r is None:
+            r = routes[route] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(BUCKETS), 'rows': 0,
+                                 **{k: 0.0 for k in KINDS}, **{f'{k}_calls': 0 for k in KINDS}}
+        r['count'] += 1
+        r['sum'] += total
+        for i, b in enumerate(BUCKETS):
+            if total <= b:
+                r['buckets'][i] += 1
+        r['rows'] += p['rows']
+        for k in KINDS:
+            r[k] += p[k]
+            r[f'{k}_calls'] += p[f'{k}_calls']
+    parts = [f'db;dur={p["db"] * 1000:.1f};desc="{p["db_calls"]} queries, {p["rows"]} rows"']
+    if p['http_calls']:
+        parts.append(f'http;dur={p["http"] * 1000:.1f};desc="{p["http_calls"]} calls"')
+    if p['image_calls']:
+        parts.append(f'img;dur={p["image"] * 1000:.1f}')
+    parts.append(f'total;dur={total * 1000:.1f}')
+    response.headers['Server-Timing'] = ', '.join(parts)
+    return response
+
+
+def _line(out, name, labels, value):
+    lab = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    out.append(f'{name}{{{lab}}} {value}')
+
+
+def metrics_text(extra=None):
+    with _lock:
+        snap = {k: dict(v, buckets=list(v['buckets'])) for k, v in routes.items()}
+        slow_total = totals['slow_queries']
+    out = ['# HELP mealmind_request_duration_seconds Request latency by route.',
+           '# TYPE mealmind_request_duration_seconds histogram']
+    for route, r in sorted(snap.items()):
+        for b, n in zip(BUCKETS, r['buckets']):
+            _line(out, 'mealmind_request_duration_seconds_bucket', {'route': route, 'le': b}, n)
+        _line(out, 'mealmind_request_duration_seconds_bucket', {'route': route, 'le': '+Inf'}, r['count'])
+        _line(out, 'mealmind_request_duration_seconds_sum', {'route': route}, round(r['sum'], 6))
+        _line(out, 'mealmind_request_duration_seconds_count', {'route': route}, r['count'])
+    for name, key, help_ in (
+        ('mealmind_db_queries_total', 'db_calls', 'Database statements executed.'),
+        ('mealmind_db_seconds_total', 'db', 'Time spent in database calls.'),
+        ('mealmind_db_rows_total', 'rows', 'Rows fetched from the database.'),
+        ('mealmind_http_calls_total', 'http_calls', 'Outbound HTTP requests.'),
+        ('mealmind_http_seconds_total', 'http', 'Time spent in outbound HTTP requests.'),
+        ('mealmind_image_seconds_total', 'image', 'Time spent decoding, resizing and encoding images.'),
+    ):
+        out += [f'# HELP {name} {help_}', f'# TYPE {name} counter']
+        for route, r in sorted(snap.items()):
+            _line(out, name, {'route': route}, round(r[key], 6) if isinstance(r[key], float) else r[key])
+    out += ['# HELP mealmind_slow_queries_total Statements over SLOW_QUERY_MS.', '# TYPE mealmind_slow_queries_total counter',
+            f'mealmind_slow_queries_total {slow_total}']
+    for name, value in (extra or {}).items():
+        out += [f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(out) + '\n'
+
+
+def slow_queries():
+    with _lock:
+        return list(slow)
@@ -0,0 +1,126 @@
+from datetime import date
+from functools import wraps
+import hashlib
+import threading
+from flask import Response, g, has_app_context, request, session
+import config
+from cache import TTLCache
+from db import query, execute
+import adb
+
+pages = TTLCache(maxsize=config.RESPONSE_CACHE_SIZE, ttl=config.RESPONSE_CACHE_TTL)
+_lock = threading.Lock()
+counters = {'hits': 0, 'misses': 0, 'not_modified': 0, 'bypass': 0}
+
+BUMP_SQL = 'UPDATE users SET data_version=data_version+1, data_updated_at=CURRENT_TIMESTAMP WHERE id=%s'
+VERSION_SQL = 'SELECT data_version, data_updated_at FROM users WHERE id=%s'
+
+
+def _count(name):
+    with _lock:
+        counters[name] += 1
+
+
+def _version(row):
+    return (row['data_version'], row['data_updated_at']) if row else (0, None)
+
+
+def _versions():
+    if not has_app_context():
+        return {}
+    return g.setdefault('_data_versions', {})
+
+
+def data_version(user_id):
+    memo = _versions()
+    if user_id not in memo:
+        memo[user_id] = _version(query(VERSION_SQL, (user_id,), one=True))
+    return memo[user_id]
+
+
+def bump(user_id):
+    execute(BUMP_SQL, (user_id,))
+    _versions().pop(user_id, None)
+
+
+def bump_dish(dish_id):
+    execute('UPDATE users SET data_version=data_version+1, data_updated_at=CURRENT_TIMESTAMP WHERE id IN (SELECT user_id FROM user_library WHERE dish_id=%s)', (dish_id,))
+
+
+def _lookup(name, extra, kwargs, version):
+    parts = [name, g.user_id, sorted(request.args.items(multi=True)), sorted(kwargs.items()), version, date.today().isoformat()]
+    if extra:
+        parts.append(extra())
+    etag = hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+    if etag in request.if_none_match:
+        _count('not_modified')
+        return etag, Response(status=304)
+    hit = pages.get(etag)
+    if hit is None:
+        _count('misses')
+        return etag, None
+    _count('hits')
+    return etag, Response(hit[0], mimetype=hit[1])
+
+
+def _store(etag, resp):
+    if not isinstance(resp, Response):
+        resp = Response(resp)
+    if resp.status_code != 200 or resp.is_streamed:
+        return resp, False
+    pages.set(etag, (resp.get_data(), resp.mimetype))
+    return resp, True
+
+
+def _finish(resp, etag, changed):
+    resp.set_etag(etag)
+    if changed:
+        resp.last_modified = changed
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def cached(name, extra=None, before=None):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if before:
+                before()
+            if session.get('_flashes'):
+                _count('bypass')
+                return fn(*args, **kwargs)
+            version, changed = data_version(g.user_id)
+            etag, resp = _lookup(name, extra, kwargs, version)
+            if resp is None:
+                resp, ok = _store(etag, fn(*args, **kwargs))
+                if not ok:
+                    return resp
+            return _finish(resp, etag, changed)
+        return wrapper
+    return deco
+
+
+def acached(name, extra=None, before=None):
+    def deco(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if before:
+                await before()
+            if session.get('_flashes'):
+                _count('bypass')
+                return await fn(*args, **kwargs)
+            version, changed = _versions()[g.user_id] = _version(await adb.query(VERSION_SQL, (g.user_id,), one=True))
+            etag, resp = _lookup(name, extra, kwargs, version)
+            if resp is None:
+                resp, ok = _store(etag, await fn(*args, **kwargs))
+                if not ok:
+                    return resp
+            return _finish(resp, etag, changed)
+        return wrapper
+    return deco
+
+
+def stats():
+    with _lock:
+        return dict(counters, **pages.stats())
@@ -0,0 +1,79 @@
+import heapq
+import random
+import config
+
+rng = random.Random(config.SAMPLER_SEED)
+
+
+def seed(n=None):
+    rng.seed(n)
+
+
+def weighted_sample(items, k, weight=None, rand=None):
+    r = rand or rng
+    heap = []
+    for i, it in enumerate(items):
+        w = weight(it) if weight else 1.0
+        if w <= 0:
+            continue
+        key = r.random() ** (1.0 / w)
+        if len(heap) < k:
+            heapq.heappush(heap, (key, i, it))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, i, it))
+    return [it for _, _, it in sorted(heap, reverse=True)]
+
+
+class AliasTable:
+    def __init__(self, items, weights):
+        self.items = list(items)
+        self.weights = list(weights)
+        n = len(self.items)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        total = float(sum(self.weights))
+        if not n or total <= 0:
+            self.items = []
+            return
+        scaled = [w * n / total for w in self.weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def draw(self, rand=None):
+        r = rand or rng
+        i = r.randrange(len(self.items))
+        return self.items[i] if r.random() < self.prob[i] else self.items[self.alias[i]]
+
+    def sample(self, k, exclude=(), rand=None):
+        n = len(self.items)
+        if not n or k <= 0:
+            return []
+        if k * 4 > n:
+            return self._scan(k, set(exclude), rand)
+        out, seen = [], set(exclude)
+        tries = k * 20
+        while len(out) < k and tries:
+            tries -= 1
+            it = self.draw(rand)
+            if it in seen:
+                continue
+            seen.add(it)
+            out.append(it)
+        if len(out) < k:
+            out.extend(self._scan(k - len(out), seen, rand))
+        return out
+
+    def _scan(self, k, exclude, rand=None):
+        picked = weighted_sample([i for i in range(len(self.items)) if self.items[i] not in exclude], k, self.weights.__getitem__, rand)
+        return [self.items[i] for i in picked]
@@ -0,0 +1,165 @@
+from datetime import datetime, time as dtime, timedelta
+import json
+import logging
+import os
+import random
+import threading
+import time
+import config
+from db import query
+from helpers import get_or_create_today_plan, ensure_weekly_web_discover, week_start
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+
+
+def _as_time(v):
+    if isinstance(v, timedelta):
+        return (datetime.min + v).time()
+    if isinstance(v, dtime):
+        return v
+    h, m = (str(v or config.SUGGESTION_TIME).split(':') + ['0'])[:2]
+    return dtime(int(h), int(m))
+
+
+class Scheduler:
+    def __init__(self, app, store, interval=60, jitter=0):
+        self.app = app
+        self.store = store
+        self.interval = interval
+        self.jitter = jitter
+        self.metrics = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        self._lockfile = None
+
+    def _leader(self):
+        if fcntl is None:
+            return True
+        if self._lockfile is None:
+            self._lockfile = open(self.store.path + '.lock', 'a')
+            try:
+                fcntl.flock(self._lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lockfile.close()
+                self._lockfile = None
+                return False
+        return True
+
+    def _offset(self, key, day):
+        if not self.jitter:
+            return timedelta()
+        return timedelta(seconds=random.Random(f'{key}:{day}').uniform(0, self.jitter))
+
+    def _run(self, job, key, mark, fn, *args):
+        m = self.metrics.setdefault(job, {'runs': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0, 'last_at': None})
+        start = time.perf_counter()
+        try:
+            with self.app.app_context():
+                fn(*args)
+            self.store.set(key, mark)
+        except Exception:
+            m['errors'] += 1
+            log.exception('scheduler job %s failed', key)
+        finally:
+            took = time.perf_counter() - start
+            m['runs'] += 1
+            m['total'] += took
+            m['last'] = took
+            m['max'] = max(m['max'], took)
+            m['last_at'] = datetime.now().isoformat(timespec='seconds')
+
+    def due_jobs(self, now=None):
+        now = now or datetime.now()
+        today, ws = now.date(), week_start(now.date())
+        with self.app.app_context():
+            users = query('SELECT user_id, notify_time, daily_suggestions, weekly_discovery FROM preferences')
+        jobs = []
+        for p in users:
+            uid = p['user_id']
+            if p['daily_suggestions']:
+                key = f'daily:{uid}'
+                due = datetime.combine(today, _as_time(p['notify_time'])) + self._offset(key, today)
+                if now >= due and self.store.get(key) != today.isoformat():
+                    jobs.append(('daily_plan', key, today.isoformat(), get_or_create_today_plan, uid))
+            if p['weekly_discovery']:
+                key = f'weekly:{uid}'
+                due = datetime.combine(ws, dtime()) + self._offset(key, ws)
+                if now >= due and self.store.get(key) != ws.isoformat():
+                    jobs.append(('weekly_discover', key, ws.isoformat(), ensure_weekly_web_discover, uid))
+        return jobs
+
+    def tick(self, now=None):
+        if not self._leader():
+            return 0
+        jobs = self.due_jobs(now)
+        for job in jobs:
+            if self.stopped.is_set():
+                break
+            self._run(*job)
+        return len(jobs)
+
+    def run_forever(self):
+        while not self.stopped.is_set():
+            try:
+                self.tick()
+            except Exception:
+                log.exception('scheduler tick failed')
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run_forever, name='scheduler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+
+scheduler = None
+
+
+def start(app):
+    global scheduler
+    if scheduler is None:
+        store = JobStore(config.SCHEDULER_STORE)
+        scheduler = Scheduler(app, store, interval=config.SCHEDULER_INTERVAL, jitter=config.SCHEDULER_JITTER).start()
+    return scheduler
+
+
+def stats():
+    return scheduler.metrics if scheduler else {}
+
+
+if __name__ == '__main__':
+    from app import app
+    logging.basicConfig(level=logging.INFO)
+    Scheduler(app, JobStore(config.SCHEDULER_STORE), interval=config.SCHEDULER_INTERVAL, jitter=config.SCHEDULER_JITTER).run_forever()
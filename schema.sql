@@ -97,14 +97,56 @@ CREATE TABLE IF NOT EXISTS discover_feed (
   KEY idx_user_week (user_id, week_start)
 );
 
+CREATE TABLE IF NOT EXISTS discover_generation (
+  user_id INT NOT NULL,
+  week_start DATE NOT NULL,
+  generated_at DATETIME NOT NULL,
+  items INT DEFAULT 0,
+  PRIMARY KEY (user_id, week_start)
+);
+
+CREATE TABLE IF NOT EXISTS library_stats (
+  user_id BIGINT PRIMARY KEY,
+  summary JSON NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS api_tokens (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  user_id BIGINT NOT NULL,
+  token_hash CHAR(64) NOT NULL,
+  label VARCHAR(100),
+  revoked TINYINT(1) DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE KEY uq_token_hash (token_hash),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS ingredient_aliases (
+  alias VARCHAR(100) PRIMARY KEY,
+  canonical VARCHAR(100) NOT NULL
+);
+
 
 INSERT INTO preferences (user_id) VALUES (1) ON DUPLICATE KEY UPDATE user_id=user_id;
 
 CREATE INDEX idx_day_plan_user_date ON day_plan (user_id, date);
 CREATE INDEX idx_day_plan_dish ON day_plan (dish_id);
+CREATE INDEX idx_user_library_active ON user_library (user_id, active);
+CREATE INDEX idx_discover_feed_rank ON discover_feed (user_id, week_start, source, sort_rank);
 
 ALTER TABLE dishes ADD INDEX idx_dishes_name (name);
 ALTER TABLE dish_ingredients ADD INDEX idx_di_ingredient (ingredient_id);
 ALTER TABLE user_library ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
 
 ALTER TABLE discover_feed ADD UNIQUE KEY uq_user_week_name (user_id, week_start, name);
+
+-- Optional, MySQL only (MariaDB has no ngram parser): FULLTEXT name search, used when NAME_FULLTEXT=1.
+-- Build it with stopwords off, otherwise every bigram containing "a" or "i" is dropped and "dal" matches nothing.
+-- SET SESSION innodb_ft_enable_stopword = OFF;
+-- ALTER TABLE dishes ADD FULLTEXT INDEX ft_dishes_name (name) WITH PARSER ngram;
+
+ALTER TABLE users ADD COLUMN data_version BIGINT NOT NULL DEFAULT 0, ADD COLUMN data_updated_at TIMESTAMP NULL;
+
+ALTER TABLE dishes ADD COLUMN created_by BIGINT NULL;
@@ -0,0 +1,134 @@
+CREATE TABLE IF NOT EXISTS users (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name VARCHAR(100),
+  email VARCHAR(255),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  data_version INTEGER NOT NULL DEFAULT 0,
+  data_updated_at TIMESTAMP NULL
+);
+
+INSERT OR IGNORE INTO users (id,name,email) VALUES (1,'Default User','user@example.com');
+
+CREATE TABLE IF NOT EXISTS dishes (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name VARCHAR(255) NOT NULL COLLATE NOCASE,
+  cuisine VARCHAR(80),
+  time_min INT,
+  difficulty VARCHAR(20),
+  veg TINYINT(1) DEFAULT 0,
+  spice_level VARCHAR(20),
+  image_url VARCHAR(500),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  created_by INTEGER,
+  CONSTRAINT uniq_dish_name UNIQUE (name)
+);
+
+CREATE TABLE IF NOT EXISTS ingredients (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name VARCHAR(120) NOT NULL COLLATE NOCASE,
+  CONSTRAINT uniq_ingredient UNIQUE (name)
+);
+
+CREATE TABLE IF NOT EXISTS dish_ingredients (
+  dish_id INTEGER NOT NULL REFERENCES dishes(id) ON DELETE CASCADE,
+  ingredient_id INTEGER NOT NULL REFERENCES ingredients(id) ON DELETE CASCADE,
+  amount_text VARCHAR(120),
+  PRIMARY KEY (dish_id, ingredient_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_library (
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  dish_id INTEGER NOT NULL REFERENCES dishes(id) ON DELETE CASCADE,
+  active TINYINT(1) DEFAULT 1,
+  rating TINYINT,
+  last_cooked_at DATE,
+  added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (user_id, dish_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS day_plan (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  date DATE NOT NULL,
+  dish_id INTEGER NOT NULL REFERENCES dishes(id) ON DELETE CASCADE,
+  is_override TINYINT(1) DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT uniq_user_date UNIQUE (user_id, date)
+);
+
+CREATE TABLE IF NOT EXISTS preferences (
+  user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  diet VARCHAR(20) DEFAULT 'None',
+  spice_level VARCHAR(20) DEFAULT 'Medium',
+  time_max INT DEFAULT 60,
+  allergies TEXT,
+  avoid TEXT,
+  notify_time TEXT DEFAULT '19:00',
+  daily_suggestions TINYINT(1) DEFAULT 1,
+  weekly_discovery TINYINT(1) DEFAULT 1,
+  auto_suggestions TINYINT(1) DEFAULT 1,
+  cooldown_days INT DEFAULT 4,
+  theme VARCHAR(10) DEFAULT 'light'
+);
+
+CREATE TABLE IF NOT EXISTS discover_feed (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  week_start DATE NOT NULL,
+  dish_id INTEGER NULL,
+  source VARCHAR(16) NOT NULL,
+  sort_rank INT DEFAULT 0,
+  name VARCHAR(255) NULL,
+  image_url VARCHAR(500) NULL,
+  source_url VARCHAR(500) NULL,
+  time_min INT NULL,
+  cuisine VARCHAR(64) NULL,
+  difficulty VARCHAR(32) NULL,
+  veg TINYINT(1) DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT uq_user_week_dish UNIQUE (user_id, week_start, dish_id),
+  CONSTRAINT uq_user_week_name UNIQUE (user_id, week_start, name)
+);
+
+CREATE TABLE IF NOT EXISTS discover_generation (
+  user_id INTEGER NOT NULL,
+  week_start DATE NOT NULL,
+  generated_at DATETIME NOT NULL,
+  items INT DEFAULT 0,
+  PRIMARY KEY (user_id, week_start)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS library_stats (
+  user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  summary TEXT NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS library_stats_touch AFTER UPDATE OF summary ON library_stats
+BEGIN
+  UPDATE library_stats SET updated_at=CURRENT_TIMESTAMP WHERE user_id=NEW.user_id;
+END;
+
+CREATE TABLE IF NOT EXISTS api_tokens (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  token_hash CHAR(64) NOT NULL,
+  label VARCHAR(100),
+  revoked TINYINT(1) DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT uq_token_hash UNIQUE (token_hash)
+);
+
+CREATE TABLE IF NOT EXISTS ingredient_aliases (
+  alias VARCHAR(100) PRIMARY KEY,
+  canonical VARCHAR(100) NOT NULL
+);
+
+INSERT OR IGNORE INTO preferences (user_id) VALUES (1);
+
+CREATE INDEX IF NOT EXISTS idx_day_plan_user_date ON day_plan (user_id, date);
+CREATE INDEX IF NOT EXISTS idx_day_plan_dish ON day_plan (dish_id);
+CREATE INDEX IF NOT EXISTS idx_user_library_active ON user_library (user_id, active);
+CREATE INDEX IF NOT EXISTS idx_discover_feed_rank ON discover_feed (user_id, week_start, source, sort_rank);
+CREATE INDEX IF NOT EXISTS idx_di_ingredient ON dish_ingredients (ingredient_id);
@@ -0,0 +1,114 @@
+from datetime import date, datetime
+import os
+import sqlite3
+import threading
+from pymysql.constants import SERVER_STATUS
+import config
+from dialect import to_sqlite
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_sqlite.sql')
+_init_lock = threading.Lock()
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(' '))
+sqlite3.register_converter('DATE', lambda b: date.fromisoformat(b.decode()))
+sqlite3.register_converter('DATETIME', lambda b: datetime.fromisoformat(b.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda b: datetime.fromisoformat(b.decode()))
+
+
+def _dict_row(cur, row):
+    return dict(zip([c[0] for c in cur.description], row))
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.cur = conn.raw.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, sql, params=()):
+        self.cur.execute(to_sqlite(sql), params or ())
+        return max(self.cur.rowcount, 0)
+
+    def executemany(self, sql, seq):
+        self.cur.executemany(to_sqlite(sql), seq)
+        return max(self.cur.rowcount, 0)
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def fetchmany(self, size):
+        return self.cur.fetchmany(size)
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    def close(self):
+        self.cur.close()
+
+    @property
+    def description(self):
+        return self.cur.description
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cur.lastrowid
+
+
+class Connection:
+    def __init__(self, raw):
+        self.raw = raw
+        self.open = True
+
+    def cursor(self, cls=None):
+        return Cursor(self)
+
+    def begin(self):
+        self.raw.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def ping(self, reconnect=False):
+        self.raw.execute('SELECT 1')
+
+    @property
+    def server_status(self):
+        return SERVER_STATUS.SERVER_STATUS_IN_TRANS if self.raw.in_transaction else 0
+
+    def close(self):
+        self.open = False
+        self.raw.close()
+
+
+def _init_schema(raw):
+    with _init_lock:
+        if raw.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'").fetchone():
+            return
+        with open(SCHEMA, encoding='utf-8') as f:
+            raw.executescript(f.read())
+
+
+def connect():
+    path = config.SQLITE_PATH
+    raw = sqlite3.connect(path, uri=path.startswith('file:'), timeout=config.SQLITE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=config.SQLITE_STATEMENT_CACHE)
+    raw.row_factory = _dict_row
+    raw.execute('PRAGMA journal_mode=WAL')
+    raw.execute('PRAGMA synchronous=NORMAL')
+    raw.execute('PRAGMA foreign_keys=ON')
+    raw.execute('PRAGMA temp_store=MEMORY')
+    raw.execute(f'PRAGMA mmap_size={int(config.SQLITE_MMAP)}')
+    _init_schema(raw)
+    return Connection(raw)